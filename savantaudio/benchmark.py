@@ -0,0 +1,133 @@
+"""
+savantaudio.benchmark.py
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Benchmarks for the client's hot paths, run against the local simulator at a range of simulated round-trip times.
+Results are printed (or written) as JSON so they can be compared between releases.
+
+    python -m savantaudio.benchmark --rtt 0 0.005 0.02 --pipeline-depth 1 32 --output bench.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+from .__version__ import __version__
+from .client import Switch
+from .simulator import Simulator
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'min': samples[0],
+        'median': statistics.median(samples),
+        'p95': samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        'max': samples[-1],
+        'mean': statistics.fmean(samples),
+    }
+
+async def bench_connect(simulator: Simulator, pipeline_depth: int, repeat: int) -> Dict[str, float]:
+    """Seconds for a cold `Switch.connect()` (new connection plus full refresh)."""
+    samples = []
+    for _ in range(repeat):
+        switch = Switch(simulator.host, simulator.port, pipeline_depth=pipeline_depth)
+        start = time.perf_counter()
+        await switch.connect()
+        samples.append(time.perf_counter() - start)
+        await switch.close()
+    return _summary(samples)
+
+async def bench_refresh(switch: Switch, repeat: int) -> Dict[str, float]:
+    """Seconds for a full `Switch.refresh()` on an open connection."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await switch.refresh()
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+async def bench_set_volume(switch: Switch, count: int) -> Dict[str, float]:
+    """`Output.set_volume` throughput with `count` calls spread over all outputs and issued concurrently."""
+    outputs = [switch.output(o) for o in range(1, switch._noutputs + 1)]
+    start = time.perf_counter()
+    await asyncio.gather(*(outputs[n % len(outputs)].set_volume(-(n % 39)) for n in range(count)))
+    elapsed = time.perf_counter() - start
+    return {'n': count, 'seconds': elapsed, 'commands_per_second': count / elapsed}
+
+async def bench_link(switch: Switch, repeat: int) -> Dict[str, float]:
+    """Seconds for a single `Switch.link` to be acknowledged."""
+    samples = []
+    for n in range(repeat):
+        start = time.perf_counter()
+        await switch.link(1 + n % switch._noutputs, 1 + n % switch._ninputs)
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+def bench_memory(count: int) -> Dict[str, float]:
+    """Bytes allocated per `Switch` with every input and output populated."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    switches = []
+    for n in range(count):
+        switch = Switch('127.0.0.1', 8085 + n)
+        for i in range(1, switch._ninputs + 1):
+            switch.input(i)
+        for o in range(1, switch._noutputs + 1):
+            switch.output(o)
+        switches.append(switch)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return {'switches': count, 'bytes_per_switch': allocated / count}
+
+async def run(rtts: List[float], pipeline_depths: List[int], repeat: int, commands: int) -> dict:
+    results = []
+    for rtt in rtts:
+        async with Simulator(latency=rtt) as simulator:
+            for depth in pipeline_depths:
+                switch = Switch(simulator.host, simulator.port, pipeline_depth=depth)
+                await switch.connect()
+                results.append({
+                    'rtt': rtt,
+                    'pipeline_depth': depth,
+                    'connect': await bench_connect(simulator, depth, repeat),
+                    'refresh': await bench_refresh(switch, repeat),
+                    'set_volume': await bench_set_volume(switch, commands),
+                    'link': await bench_link(switch, repeat * 10),
+                })
+                await switch.close()
+    return {
+        'version': __version__,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'memory': bench_memory(100),
+        'results': results,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the savantaudio client against the simulator')
+    parser.add_argument('--rtt', type=float, nargs='+', default=[0.0, 0.002, 0.01], help='simulated round-trip times in seconds')
+    parser.add_argument('--pipeline-depth', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--commands', type=int, default=200, help='set_volume calls per throughput run')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+    results = asyncio.run(run(args.rtt, args.pipeline_depth, args.repeat, args.commands))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -7,15 +7,24 @@ Client class to interact with Savant Audio switch
 
 import abc
 import asyncio
-from dataclasses import dataclass
+import collections
+import contextlib
+from array import array
+from dataclasses import dataclass, field
 from genericpath import exists
 from operator import truediv
-from typing import Dict, Optional, Sequence, Tuple, TypeVar
-from enum import Enum
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
+from enum import Enum, Flag, IntEnum, auto
 from xmlrpc.client import Boolean
 import re
 import logging
-import datetime
+import json
+import os
+import random
+import time
+
+from .events import Change, ChangeStream, EventBus, Subscription
+from .metrics import Hooks
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -23,88 +32,667 @@ class Model(Enum):
     SSA_3220 = 'SSA-3200'
     SSA_3220D = 'SSA-3220D'
 
+class Priority(IntEnum):
+    """Scheduling class of a command; lower values are sent first when commands are waiting for the connection."""
+    INTERACTIVE = 0 # a user is waiting: links, settings, reads with a deadline
+    SCENE = 1 # bulk changes: scenes and reconciliation
+    POLL = 2 # background reads: refreshes, polling, keepalive
+
+class Scope(Flag):
+    """What `Switch.refresh` should fetch from the device."""
+    INFO = auto()
+    LINKS = auto()
+    INPUT_TRIM = auto()
+    INPUT_CONF = auto()
+    OUTPUT_VOLUME = auto()
+    OUTPUT_CONF = auto()
+    OUTPUT_MUTE = auto()
+    OUTPUT_MONO = auto()
+    OUTPUT_DELAY = auto()
+    INPUTS = INPUT_TRIM | INPUT_CONF
+    OUTPUTS = OUTPUT_VOLUME | OUTPUT_CONF | OUTPUT_MUTE | OUTPUT_MONO | OUTPUT_DELAY
+    ALL = INFO | LINKS | INPUTS | OUTPUTS
+
+@dataclass
+class OutputSettings:
+    """Desired settings for one output; attributes left as None are not changed."""
+    volume: Optional[int] = None
+    mute: Optional[bool] = None
+    mono: Optional[bool] = None
+    passthru: Optional[bool] = None
+    delay: Optional[Tuple[int, int]] = None
+
+@dataclass
+class Scene:
+    """Desired state of a switch: `links` maps output -> input (None to disconnect), `outputs` maps output -> settings."""
+    links: Dict[int, Optional[int]] = field(default_factory=dict)
+    outputs: Dict[int, OutputSettings] = field(default_factory=dict)
+
+@dataclass
+class CommandResult:
+    """Outcome of one command sent by `Switch.apply_scene`."""
+    command: str
+    ok: bool
+    replies: List[str] = field(default_factory=list)
+    error: Optional[Exception] = None
+
+_IO_COMMAND = re.compile(r'(ainput|aoutput)-([a-z]+)-(?:get|set)(\d+)')
+_SWITCH_COMMAND = re.compile(r'switch-(?:get|set)(\d+)')
+
+def _reply_prefixes(command: str) -> Optional[Tuple[str, ...]]:
+    """Return the prefixes a reply line to `command` can start with, or None if any line could be a reply."""
+    m = _IO_COMMAND.match(command)
+    if m:
+        kind, attribute, number = m.groups()
+        if attribute == 'delayboth':
+            return (f'{kind}-delayleft{number}:', f'{kind}-delayright{number}:', 'err')
+        return (f'{kind}-{attribute}{number}:', f'{kind}-{attribute}-get{number}:', f'{kind}-{attribute}-set{number}:', 'err')
+    m = _SWITCH_COMMAND.match(command)
+    if m:
+        return (f'switch{m.group(1)}.', 'err')
+    if command in ('fwrev', 'fpga-rev', 'status'):
+        return (command, 'err')
+    return None
+
+
+_DIGITS = '0123456789'
+_IO_REPLY = re.compile(r'(ainput|aoutput)-([a-z\-]+?)(?:-get|-set)?(\d+):(.*)')
+_SWITCH_REPLY = re.compile(r'switch(\d+)\.(\d+)')
+_FWREV_REPLY = re.compile(r'fwrevPrimary; (.*)')
+_STATUS_REPLY = re.compile(r'statusAPI1.0; (.*)')
+
+def _tokenize(value: str) -> Optional[Tuple[str, str, int, str]]:
+    """Split a reply line into (kind, attribute, index, value), e.g. 'aoutput-vol11:-20dB' -> ('aoutput', 'vol', 11, '-20dB').
+
+    The common `switchN.M` and `aoutput-attrN:value` shapes are split without regular expressions.
+    """
+    if value.startswith('a'):
+        kind, _, rest = value.partition('-')
+        head, sep, argument = rest.partition(':')
+        attribute = head.rstrip(_DIGITS)
+        if sep and len(attribute) < len(head) and kind in ('aoutput', 'ainput'):
+            index = int(head[len(attribute):])
+            if attribute.endswith(('-get', '-set')):
+                attribute = attribute[:-4]
+            return (kind, attribute, index, argument)
+        m = _IO_REPLY.search(value)
+        if m:
+            return (m.group(1), m.group(2), int(m.group(3)), m.group(4))
+    elif value.startswith('switch'):
+        output, sep, input = value[6:].partition('.')
+        if sep and output.isdigit() and input.isdigit():
+            return ('switch', '', int(output), input)
+        m = _SWITCH_REPLY.search(value)
+        if m:
+            return ('switch', '', int(m.group(1)), m.group(2))
+    elif value.startswith('fwrev'):
+        m = _FWREV_REPLY.match(value)
+        if m:
+            return ('fwrev', '', 0, m.group(1))
+    elif value.startswith('fpga-rev'):
+        return ('fpga-rev', '', 0, value[8:])
+    elif value.startswith('status'):
+        m = _STATUS_REPLY.match(value)
+        if m:
+            return ('status', '', 0, m.group(1))
+    return None
+
+# the longest line the switch could sensibly send; anything longer means the stream is garbage
+_MAX_LINE = 65536
+
+def _units(value: str) -> int:
+    """'-20dB' -> -20, '15ms' -> 15"""
+    return int(value.rstrip('dBms'))
+
+
+class _Request:
+    """A command that has been (or is about to be) written to the switch, along with the reply lines received so far."""
+
+    def __init__(self, command: str):
+        self.command = command
+        self.lines = []
+        self.prefixes = _reply_prefixes(command)
+        self.future = asyncio.get_running_loop().create_future()
+        self.sent = 0.0 # loop time it was written
+
+    def matches(self, line: str) -> bool:
+        return self.prefixes is None or line.startswith(self.prefixes)
+
+
+class _LineProtocol(asyncio.Protocol):
+    """Splits the byte stream from a switch into lines and hands them to its `Connection`.
+
+    Data is appended to one bytearray and split on newlines in place, so a packet holding many lines (or part of one)
+    costs a single buffer append, and each line is decoded straight out of the buffer.  Blank lines (reply terminators)
+    are recognised without decoding anything.
+    """
+
+    def __init__(self, connection: 'Connection'):
+        self._connection = connection
+        self._buffer = bytearray()
+        self._paused = False
+        self._drain_waiters = collections.deque()
+        self.transport = None
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+
+    def data_received(self, data: bytes):
+        connection = self._connection
+        connection._data_received(len(data))
+        buffer = self._buffer
+        buffer += data
+        end = buffer.find(b'\n')
+        if end < 0:
+            if len(buffer) > _MAX_LINE:
+                connection._protocol_lost(self, ConnectionResetError(f'Line longer than {_MAX_LINE} bytes'))
+            return
+        start = 0
+        with memoryview(buffer) as view:
+            while end >= 0:
+                stop = end
+                if stop > start and buffer[stop - 1] == 13: # \r
+                    stop -= 1
+                connection._line_received('' if stop == start else str(view[start:stop], 'utf-8', 'replace').strip())
+                start = end + 1
+                end = buffer.find(b'\n', start)
+        del buffer[:start]
+
+    def connection_lost(self, exc: Optional[Exception]):
+        while self._drain_waiters:
+            waiter = self._drain_waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(ConnectionResetError('Connection lost'))
+        if not self.closed.done():
+            self.closed.set_result(None)
+        self._connection._protocol_lost(self, exc)
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        while self._drain_waiters:
+            waiter = self._drain_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def drain(self):
+        """Wait until the transport's write buffer has room, like `StreamWriter.drain`."""
+        if self.transport.is_closing():
+            raise ConnectionResetError('Connection lost')
+        if self._paused:
+            waiter = asyncio.get_running_loop().create_future()
+            self._drain_waiters.append(waiter)
+            await waiter
+
+
+class _Slots:
+    """The pipeline window of a `Connection`, handed out by `Priority`.
+
+    A free slot goes to the most urgent waiting command, so an interactive command overtakes a queued refresh sweep
+    instead of waiting behind it.  For fairness, a class that has been passed over `patience` times in a row gets the
+    next slot anyway, so background traffic keeps moving under sustained interactive load.  When the window is deeper
+    than one, its last slot is kept for interactive commands, which can then be written without waiting for any reply.
+    """
+
+    def __init__(self, size: int, patience: int = 8) -> None:
+        self._size = size
+        self._reserved = 1 if size > 1 else 0
+        self._patience = patience
+        self._used = 0
+        self._waiters = tuple(collections.deque() for _ in Priority) # futures, by priority
+        self._passed = [0] * len(Priority)
+
+    @property
+    def waiting(self) -> Dict[str, int]:
+        return {priority.name.lower(): len(self._waiters[priority]) for priority in Priority}
+
+    def _available(self, priority: int) -> bool:
+        return self._used < (self._size if priority == Priority.INTERACTIVE else self._size - self._reserved)
+
+    async def acquire(self, priority: Priority):
+        if self._available(priority) and not any(self._waiters):
+            self._used += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        self._grant()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release() # granted just as we were cancelled; pass it on
+            else:
+                try:
+                    self._waiters[priority].remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self):
+        self._used -= 1
+        self._grant()
+
+    def _grant(self):
+        while True:
+            for waiters in self._waiters:
+                while waiters and waiters[0].done():
+                    waiters.popleft() # cancelled
+            waiting = [priority for priority in Priority if self._waiters[priority] and self._available(priority)]
+            if not waiting:
+                return
+            chosen = waiting[0]
+            for priority in waiting[1:]:
+                self._passed[priority] += 1
+                if self._passed[priority] > self._patience and chosen == waiting[0]:
+                    chosen = priority
+            self._passed[chosen] = 0
+            self._used += 1
+            self._waiters[chosen].popleft().set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def hold(self, priority: Priority):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
 class Connection:
-    def __init__(self, host: str, port: int):
+    """Connection to a switch.
+
+    Commands are written to the socket as soon as a pipeline slot is free, so up to `pipeline_depth` commands can be
+    outstanding at once.  A reader task matches each blank-line terminated reply block to the oldest outstanding command
+    (the switch answers in order), and resolves that command's future.  A `pipeline_depth` of 1 gives the classic
+    one-command-per-round-trip behaviour.
+
+    Lines that do not look like a reply to the oldest outstanding command (or that arrive when nothing is outstanding)
+    are state changes pushed by the switch.  They are passed, in order, to `handler` without holding up the reader.
+
+    A watchdog treats the connection as dead if commands are outstanding but nothing has been received for
+    `read_timeout` seconds, and sends a probe after `keepalive` seconds of silence so half-open sessions are noticed
+    while idle.  A connection lost unexpectedly is re-established in the background with jittered exponential backoff
+    (from `reconnect_delay` up to `max_reconnect_delay`), after which `on_reconnect` is called so the owner can resync.
+    A command whose connection fails under it is re-sent up to `max_retries` times before the error is raised.
+
+    `hooks` (see `savantaudio.metrics.Hooks`) is told about each command, the bytes sent and received, lock waits,
+    retries and the number of commands in flight.
+    """
+
+    def __init__(self, host: str, port: int, pipeline_depth: int = 1, handler: Optional[Callable[[str], Awaitable]] = None,
+                 connect_timeout: float = 10.0, read_timeout: float = 10.0, keepalive: Optional[float] = 30.0,
+                 reconnect_delay: float = 0.1, max_reconnect_delay: float = 30.0,
+                 on_reconnect: Optional[Callable[[], Awaitable]] = None, hooks: Optional[Hooks] = None,
+                 max_retries: Optional[int] = 5):
         self._host = host
         self._port = port
-        self._writer = None
+        self._transport = None
+        self._protocol = None
+        self._watchdog_task = None
+        self._reconnect_task = None
+        self._resync_task = None
         self._lock = asyncio.Lock()
+        self._pipeline_depth = max(1, pipeline_depth)
+        self._slots = _Slots(self._pipeline_depth)
+        self._pending = collections.deque() # of _Request, in the order they were written
+        self._handler = handler
+        self._unsolicited = collections.deque()
+        self._dispatch_task = None
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._keepalive = keepalive
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._max_retries = max_retries
+        self._on_reconnect = on_reconnect
+        self._hooks = hooks
+        self._wanted = False # whether the owner wants the connection open, i.e. it has not been closed explicitly
+        self._ts = 0.0 # loop time of the last write
+        self._received = 0.0 # loop time of the last data received
+        self._connections = 0
+        self._down_since = None
+        self.reconnects = 0
+        self.downtime = 0.0
+        self.last_error = None
     
+    @property
+    def pipeline_depth(self) -> int:
+        return self._pipeline_depth
+
+    @property
+    def hooks(self) -> Optional[Hooks]:
+        return self._hooks
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def connected(self) -> bool:
+        return self._transport is not None and not self._transport.is_closing()
+
+    @property
+    def stats(self) -> dict:
+        """Health counters: reconnects, seconds spent disconnected (including any current outage), last error, and the
+        number of commands waiting to be sent in each priority class."""
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += asyncio.get_running_loop().time() - self._down_since
+        return {
+            'connected': self.connected,
+            'reconnects': self.reconnects,
+            'downtime': downtime,
+            'in_flight': self.in_flight,
+            'queued': self._slots.waiting,
+            'last_error': None if self.last_error is None else str(self.last_error),
+        }
+
     async def connect(self):
         async with self._lock:
             await self._connect()
 
     async def _connect(self):
-        if self._writer is None:
+        self._wanted = True
+        if self._transport is None:
             _LOGGER.debug(f'Opening Connection to {self._host}:{self._port}')
-            self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
-            self._ts = datetime.datetime.now()
+            loop = asyncio.get_running_loop()
+            self._transport, self._protocol = await asyncio.wait_for(
+                loop.create_connection(lambda: _LineProtocol(self), self._host, self._port), self._connect_timeout)
+            self._ts = self._received = loop.time()
+            self._watchdog_task = asyncio.create_task(self._watchdog(self._protocol))
+            self._connections += 1
+            if self._down_since is not None:
+                self.downtime += loop.time() - self._down_since
+                self._down_since = None
+            if self._connections > 1:
+                self.reconnects += 1
+                _LOGGER.info(f'Reconnected to {self._host}:{self._port}')
+                if self._on_reconnect is not None and (self._resync_task is None or self._resync_task.done()):
+                    # not awaited: resyncing sends commands, which needs the lock we are holding.  A resync that is
+                    # still running carries on over the new connection, so there is no need for another.
+                    self._resync_task = asyncio.create_task(self._resync())
+
+    async def _resync(self):
+        try:
+            await self._on_reconnect()
+        except Exception as ex:
+            _LOGGER.warning(f'Resync after reconnecting to {self._host}:{self._port} failed: {ex}')
 
     async def close(self):
         async with self._lock:
             await self._close()
 
     async def _close(self):
-        if self._writer is not None:
+        self._wanted = False
+        for task in (self._reconnect_task, self._resync_task):
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+        self._reconnect_task = None
+        self._resync_task = None
+        if self._down_since is not None:
+            self.downtime += asyncio.get_running_loop().time() - self._down_since
+            self._down_since = None
+        if self._transport is not None:
             _LOGGER.debug(f'Closing Connection to {self._host}:{self._port}')
+            protocol = self._protocol
+            self._abort(ConnectionAbortedError(f'Connection to {self._host}:{self._port} closed'))
+            await protocol.closed
+
+    def _abort(self, exc: Exception):
+        """Tear down the socket and its tasks, failing every outstanding command with `exc`."""
+        if self._watchdog_task is not None and self._watchdog_task is not asyncio.current_task():
+            self._watchdog_task.cancel()
+        self._watchdog_task = None
+        if self._transport is not None:
+            self._transport.close()
+        self._transport = None
+        self._protocol = None
+        if self._pending and self._hooks is not None:
+            self._hooks.in_flight_changed(0)
+        while self._pending:
+            request = self._pending.popleft()
+            if not request.future.done():
+                request.future.set_exception(exc)
+
+    def _lost(self, exc: Exception):
+        """The connection failed underneath us: tear it down and start reconnecting in the background."""
+        if self._transport is None:
+            return
+        _LOGGER.warning(f'Lost connection to {self._host}:{self._port}: {exc}')
+        self.last_error = exc
+        self._down_since = asyncio.get_running_loop().time()
+        self._abort(exc)
+        if self._wanted and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    def _backoff(self, attempt: int) -> float:
+        """Delay before reconnect attempt number `attempt` (0 = first): exponential, with full jitter."""
+        if attempt == 0:
+            return 0.0
+        return random.uniform(0, min(self._max_reconnect_delay, self._reconnect_delay * 2 ** (attempt - 1)))
+
+    async def _reconnect(self):
+        attempt = 0
+        while self._wanted and self._transport is None:
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+            try:
+                async with self._lock:
+                    if self._wanted:
+                        await self._connect()
+            except OSError as ex:
+                self.last_error = ex
+                _LOGGER.debug(f'Reconnect to {self._host}:{self._port} failed: {ex}')
+
+    async def _watchdog(self, protocol: _LineProtocol):
+        loop = asyncio.get_running_loop()
+        intervals = [t for t in (self._read_timeout, self._keepalive) if t]
+        if not intervals:
+            return
+        tick = min(intervals) / 4
+        while self._protocol is protocol:
+            await asyncio.sleep(tick)
+            now = loop.time()
+            if self._read_timeout and self._pending and now - max(self._received, self._pending[0].sent) > self._read_timeout:
+                self._lost(ConnectionResetError(f'No reply from {self._host}:{self._port} in {self._read_timeout}s'))
+            elif self._keepalive and not self._pending and now - max(self._ts, self._received) > self._keepalive:
+                self._ts = now
+                asyncio.create_task(self._probe())
+
+    async def _probe(self):
+        try:
+            await self.request('fwrev', priority=Priority.POLL)
+        except Exception as ex:
+            _LOGGER.debug(f'Keepalive to {self._host}:{self._port} failed: {ex}')
+
+    def _data_received(self, count: int):
+        self._received = asyncio.get_running_loop().time()
+        if self._hooks is not None:
+            self._hooks.data_received(count)
+
+    def _protocol_lost(self, protocol: _LineProtocol, exc: Optional[Exception]):
+        if self._protocol is not protocol:
+            return # closed on purpose, or already replaced
+        _LOGGER.debug(f'Reader for {self._host}:{self._port} stopped: {exc}')
+        if exc is None:
+            exc = ConnectionResetError(f'Connection closed by {self._host}:{self._port}')
+        self._lost(exc if isinstance(exc, ConnectionResetError) else ConnectionResetError(str(exc)))
+
+    def _line_received(self, line: str):
+        request = self._pending[0] if self._pending else None
+        if len(line) > 0 and (request is None or not request.matches(line)):
+            if (request is not None and request.future.cancelled() and len(request.lines) == 0 and len(self._pending) > 1
+                    and self._pending[1].prefixes is not None and self._pending[1].matches(line)):
+                # the oldest command timed out and its reply is evidently never coming; this is the next one's reply
+                _LOGGER.debug(f'Giving up on reply to {request.command}')
+                self._pending.popleft()
+                if self._hooks is not None:
+                    self._hooks.in_flight_changed(len(self._pending))
+                self._line_received(line)
+                return
+            self._dispatch(line)
+        elif request is None:
+            pass # stray terminator
+        elif len(line) > 0:
+            request.lines.append(line)
+        elif len(request.lines) > 0:
+            self._pending.popleft()
+            if self._hooks is not None:
+                self._hooks.in_flight_changed(len(self._pending))
+            if not request.future.done():
+                request.future.set_result(request.lines)
+        else:
+            _LOGGER.debug(f'Ignoring empty response to {request.command}')
+
+    def _dispatch(self, line: str):
+        if self._handler is None:
+            _LOGGER.debug(f'Discarding unsolicited reply: {line}')
+            return
+        self._unsolicited.append(line)
+        if self._dispatch_task is None or self._dispatch_task.done():
+            self._dispatch_task = asyncio.create_task(self._dispatch_loop())
+
+    async def _dispatch_loop(self):
+        while self._unsolicited:
+            line = self._unsolicited.popleft()
             try:
-                self._writer.close()
-                await self._writer.wait_closed()
-            except:
-                pass #ignore
-            self._writer = None
+                await self._handler(line)
+            except Exception as ex:
+                _LOGGER.exception(f'Handler failed for unsolicited reply {line}: {ex}', exc_info=ex)
 
     def reader(self):
-        return self._reader
+        return self._protocol
     
     @property
     def writer(self):
-        return self._writer
-    
-    async def send(self, command: str) -> str:
+        return self._transport
+
+    async def request(self, command: str, timeout: Optional[float] = None,
+                      priority: Priority = Priority.INTERACTIVE) -> List[str]:
+        """Send `command` and return the lines of its reply.
+
+        Commands waiting for room in the pipeline are sent in `priority` order (see `_Slots`).
+
+        The connection is (re)opened as needed, and the command is re-sent (after a backoff delay if it keeps
+        happening, and at most `max_retries` times) if the connection is reset before the reply arrives.  If that
+        all takes longer than `timeout` seconds, TimeoutError is raised.  Timing out or being cancelled never leaves
+        the stream out of step: a command that was already written keeps its place in the queue, and its reply is read
+        and discarded when it arrives.
+        """
+        hooks = self._hooks
+        if hooks is None:
+            async with asyncio.timeout(timeout):
+                return await self._request(command, priority)
+        loop = asyncio.get_running_loop()
+        context = hooks.command_started(command)
+        start = loop.time()
+        try:
+            async with asyncio.timeout(timeout):
+                replies = await self._request(command, priority)
+        except BaseException as ex:
+            hooks.command_finished(command, context, loop.time() - start, ex)
+            raise
+        hooks.command_finished(command, context, loop.time() - start, None)
+        return replies
+
+    async def _request(self, command: str, priority: Priority) -> List[str]:
+        attempt = 0
         while True:
+            request = None
             try:
-                async with self._lock:
-                    if self._writer is None:
-                        await self._connect() # already holding lock
-                    self._ts = datetime.datetime.now()
-                    self._writer.write(command.encode("ASCII") + b"\r\n")
-                    await self._writer.drain()
-                    data = await self._reader.readline()
-                    response = data.decode().strip()
-                    if len(response) > 0: 
-                        yield response
-                    else:
-                        _LOGGER.debug(f'Failed to get response to {command}. Retrying')
-                        await self._close() # already holding lock
-                        continue
-                    while True:
-                        data = await self._reader.readline()
-                        response = data.decode().strip()
-                        if len(response) > 0: 
-                            yield response
-                        else:
-                            return
+                async with self._slots.hold(priority):
+                    loop = asyncio.get_running_loop()
+                    waiting = loop.time()
+                    async with self._lock:
+                        waited = loop.time() - waiting
+                        if self._transport is None:
+                            await self._connect() # already holding lock
+                        request = _Request(command)
+                        self._ts = request.sent = loop.time()
+                        self._pending.append(request)
+                        data = command.encode("ASCII") + b"\r\n"
+                        self._transport.write(data)
+                        if self._hooks is not None:
+                            self._hooks.lock_waited(waited)
+                            self._hooks.data_sent(len(data))
+                            self._hooks.in_flight_changed(len(self._pending))
+                        await self._protocol.drain()
+                    return await request.future
             except ConnectionResetError as cre:
                 _LOGGER.debug(f'Connection reset: {cre}')
-                await self.close()
+                self._lost(cre)
+                if request is not None and request.future.done() and not request.future.cancelled():
+                    request.future.exception() # failed by _lost while we were still writing; nobody else will look
+                attempt += 1
+                if self._max_retries is not None and attempt > self._max_retries:
+                    raise
+                if self._hooks is not None:
+                    self._hooks.retried(command, cre)
+                await asyncio.sleep(self._backoff(attempt - 1))
+            except ConnectionAbortedError:
+                raise # closed on purpose
+            except OSError as ex:
+                # could not (re)connect: leave any background reconnect running, and let the caller decide what next
+                _LOGGER.debug(f'Connecting to {self._host}:{self._port} failed: {ex}')
+                self.last_error = ex
+                raise
             except Exception as ex:
                 _LOGGER.exception(f'Connection got exception: {ex}', exc_info=ex)
                 await self.close()
                 raise
+
+    async def send(self, command: str):
+        for response in await self.request(command):
+            yield response
     
     def check(self):
-        return self._writer.is_closing()
+        return not self.connected
+
+
+class _InputState:
+    """State of every input of a switch, in arrays indexed by input number."""
+    __slots__ = ('trim', 'coaxial', 'valid')
+
+    def __init__(self, size: int):
+        self.trim = array('h', [0]) * size
+        self.coaxial = array('b', [1]) * size
+        self.valid = array('b', [0]) * size
+
+    def copy_from(self, other: '_InputState'):
+        for name in self.__slots__:
+            getattr(self, name)[:] = getattr(other, name)
+
+
+class _OutputState:
+    """State of every output of a switch, in arrays indexed by output number."""
+    __slots__ = ('volume', 'mute', 'stereo', 'passthru', 'delayleft', 'delayright', 'valid')
+
+    def __init__(self, size: int):
+        self.volume = array('h', [0]) * size
+        self.mute = array('b', [0]) * size
+        self.stereo = array('b', [1]) * size
+        self.passthru = array('b', [0]) * size
+        self.delayleft = array('h', [0]) * size
+        self.delayright = array('h', [0]) * size
+        self.valid = array('b', [0]) * size
+
+    def copy_from(self, other: '_OutputState'):
+        for name in self.__slots__:
+            getattr(self, name)[:] = getattr(other, name)
 
 
 class Input:
+    """View of one input; the state itself lives in the switch's `_InputState` arrays."""
+    __slots__ = ('_switch', '_state', '_number', '_name')
+
     def __init__(self, switch, number: int, name: str):
         self._switch = switch
+        self._state = switch._input_state
         self._number = number
         self._name = name
-        self._coaxial = True
-        self._trim = 0
-        self._valid = False
     
     @property
     def number(self):
@@ -116,59 +704,89 @@ class Input:
     
     @property
     def coaxial(self):
-        return self._coaxial
+        return bool(self._state.coaxial[self._number])
     
     @property
     def valid(self):
-        return self._valid
+        return bool(self._state.valid[self._number])
     
     @property
     def trim(self):
-        return self._trim
+        return self._state.trim[self._number]
     
     def __str__(self):
-        return f'Input_{self._number}{{{"Coaxial" if self._coaxial else "TOSLINK"}, trim={self._trim}dB}}'
+        return f'Input_{self._number}{{{"Coaxial" if self.coaxial else "TOSLINK"}, trim={self.trim}dB}}'
        
-    async def updated(self):
-        _LOGGER.info(f'Output {self._number} Updated: {self}')
-        await self._switch._updated("input-updated", self)
+    async def updated(self, attribute: Optional[str] = None, old = None, new = None):
+        _LOGGER.info(f'Input {self._number} Updated: {self}')
+        changes = () if attribute is None else (Change("input-updated", self._number, attribute, old, new, time.time()),)
+        await self._switch._updated("input-updated", self, changes)
+
+    async def _parse_trim(self, value: str):
+        trim = _units(value)
+        self._state.valid[self._number] = True
+        old = self._state.trim[self._number]
+        if old != trim:
+            self._state.trim[self._number] = trim
+            await self.updated('trim', old, trim)
+
+    async def _parse_conf(self, value: str):
+        coaxial = value == 'coaxial'
+        old = bool(self._state.coaxial[self._number])
+        if old != coaxial:
+            self._state.coaxial[self._number] = coaxial
+            await self.updated('coaxial', old, coaxial)
+
+    _PARSERS = {
+        'trim': _parse_trim,
+        'conf': _parse_conf,
+    }
 
     async def parse(self, key: str, value: str):
-        if key == 'trim':
-            if self._trim != int(value[:-2]):
-                self._trim = int(value[:-2])
-                await self.updated()
-            self._valid = True
-        elif key == 'conf':
-            if self._coaxial != (value == 'coaxial'):
-                self._coaxial = value == 'coaxial'
-                await self.updated()
+        parser = self._PARSERS.get(key)
+        if parser is None:
+            _LOGGER.debug("Input.parse ignoring %s => %s", key, value)
+            return False
+        await parser(self, value)
         return True
         
-    async def set_trim(self, trim: int):
-        await self._switch.send_command(f'ainput-trim-set{self._number}:{trim}')
-        pass
+    async def set_trim(self, trim: int, timeout: Optional[float] = None):
+        await self._switch.send_command(f'ainput-trim-set{self._number}:{trim}', timeout)
     
-    async def set_coaxial(self, coax: bool):
-        await self._switch.send_command(f'ainput-conf-set{self._number}:{"coaxial" if coax else "toslink"}')
-        pass
+    async def set_coaxial(self, coax: bool, timeout: Optional[float] = None):
+        await self._switch.send_command(f'ainput-conf-set{self._number}:{"coaxial" if coax else "toslink"}', timeout)
+
+    def _refresh_commands(self, scope: Scope = Scope.INPUTS):
+        commands = []
+        if Scope.INPUT_TRIM in scope:
+            commands.append(f'ainput-trim-get{self._number}')
+        if Scope.INPUT_CONF in scope:
+            commands.append(f'ainput-conf-get{self._number}')
+        return commands
+
+    async def refresh(self, scope: Scope = Scope.INPUTS, max_age: Optional[float] = None, timeout: Optional[float] = None):
+        async with asyncio.timeout(timeout):
+            await self._switch._fetch_all(self._refresh_commands(scope), max_age)
+
+    async def get_trim(self, max_age: Optional[float] = None, timeout: Optional[float] = None) -> int:
+        """The trim, fetched from the switch unless it was fetched less than `max_age` seconds ago."""
+        await self._switch._read_through(f'ainput-trim-get{self._number}', max_age, timeout)
+        return self.trim
 
-    async def refresh(self):
-        await self._switch.send_command(f'ainput-trim-get{self._number}')
-        await self._switch.send_command(f'ainput-conf-get{self._number}')
+    async def get_coaxial(self, max_age: Optional[float] = None, timeout: Optional[float] = None) -> bool:
+        await self._switch._read_through(f'ainput-conf-get{self._number}', max_age, timeout)
+        return self.coaxial
         
 
 class Output:
+    """View of one output; the state itself lives in the switch's `_OutputState` arrays."""
+    __slots__ = ('_switch', '_state', '_number', '_name')
+
     def __init__(self, switch, number: int, name: str):
         self._switch = switch
+        self._state = switch._output_state
         self._number = number
         self._name = name
-        self._stereo = True
-        self._passthru = False
-        self._volume = 0
-        self._mute = False
-        self._delay = [0, 0]
-        self._valid = False
     
     @property
     def number(self) -> int:
@@ -178,98 +796,243 @@ class Output:
     def name(self) -> str:
         return self._name
     
+    @property
+    def valid(self) -> bool:
+        return bool(self._state.valid[self._number])
+
     @property
     def mute(self) -> bool:
-        return self._mute
+        return bool(self._state.mute[self._number])
     
     @property
     def stereo(self) -> bool:
-        return self._stereo
+        return bool(self._state.stereo[self._number])
     
     @property
     def passthru(self) -> bool:
-        return self._passthru
+        return bool(self._state.passthru[self._number])
     
     @property
     def volume(self) -> int:
-        return self._volume
+        return self._state.volume[self._number]
     
     @property
     def delay(self) -> tuple:
-        return self._delay
+        return (self._state.delayleft[self._number], self._state.delayright[self._number])
       
     def __str__(self):
-        return f'Output_{self._number}{{{"Stereo" if self._stereo else "Mono"}, {"Passthru" if self._passthru else "Processed"}, volume={self._volume}dB, delay={self._delay[0]}/{self._delay[1]}ms}}'
+        delay = self.delay
+        return f'Output_{self._number}{{{"Stereo" if self.stereo else "Mono"}, {"Passthru" if self.passthru else "Processed"}, volume={self.volume}dB, delay={delay[0]}/{delay[1]}ms}}'
    
-    async def updated(self):
+    async def updated(self, attribute: Optional[str] = None, old = None, new = None):
         _LOGGER.info(f'Output {self._number} Updated: {self}')
-        await self._switch._updated("output-updated", self)
+        changes = () if attribute is None else (Change("output-updated", self._number, attribute, old, new, time.time()),)
+        await self._switch._updated("output-updated", self, changes)
+
+    async def _set(self, values: array, attribute: str, new):
+        """Store a parsed value, and fire an update if it differs from the cached one."""
+        old = values[self._number]
+        if old != new:
+            values[self._number] = new
+            if values.typecode == 'b':
+                old, new = bool(old), bool(new)
+            await self.updated(attribute, old, new)
+
+    async def _parse_vol(self, value: str):
+        self._state.valid[self._number] = True
+        await self._set(self._state.volume, 'volume', _units(value))
+
+    async def _parse_mute(self, value: str):
+        await self._set(self._state.mute, 'mute', value == 'on')
+
+    async def _parse_conf(self, value: str):
+        await self._set(self._state.passthru, 'passthru', value == 'passthru')
+
+    async def _parse_mono(self, value: str):
+        await self._set(self._state.stereo, 'stereo', value == 'off')
+
+    async def _parse_delayleft(self, value: str):
+        await self._set(self._state.delayleft, 'delayleft', _units(value))
+
+    async def _parse_delayright(self, value: str):
+        await self._set(self._state.delayright, 'delayright', _units(value))
+
+    _PARSERS = {
+        'vol': _parse_vol,
+        'mute': _parse_mute,
+        'conf': _parse_conf,
+        'mono': _parse_mono,
+        'delayleft': _parse_delayleft,
+        'delayright': _parse_delayright,
+    }
 
     async def parse(self, key: str, value: str):
-        _LOGGER.debug(f"Output.parse({key} => {value})")
-        if key == 'vol':
-            self._volume = int(value[:-2])
-            self._valid = True
-        elif key == 'mute':
-            self._mute = (value == 'on')
-        elif key == 'conf':
-            self._passthru = (value == 'passthru')
-        elif key == 'mono':
-            self._stereo = (value == 'off')
-        elif key == 'delayleft':
-            self._delay[0] = int(value[:-2])
-        elif key == 'delayright':
-            self._delay[1] = int(value[:-2])
+        _LOGGER.debug("Output.parse(%s => %s)", key, value)
+        parser = self._PARSERS.get(key)
+        if parser is None:
+            return False
+        await parser(self, value)
         return True
 
-    async def refresh(self):
+    def _refresh_commands(self, scope: Scope = Scope.OUTPUTS):
+        commands = []
+        if Scope.OUTPUT_VOLUME in scope:
+            commands.append(f'aoutput-vol-get{self._number}')
+        if Scope.OUTPUT_CONF in scope:
+            commands.append(f'aoutput-conf-get{self._number}')
+        if Scope.OUTPUT_MUTE in scope:
+            commands.append(f'aoutput-mute-get{self._number}')
+        if Scope.OUTPUT_MONO in scope:
+            commands.append(f'aoutput-mono-get{self._number}')
+        if Scope.OUTPUT_DELAY in scope and self._has_delay():
+            commands.append(f'aoutput-delayboth-get{self._number}')
+        return commands
+
+    async def refresh(self, scope: Scope = Scope.OUTPUTS, max_age: Optional[float] = None, timeout: Optional[float] = None):
         _LOGGER.debug("Output[%d].refresh", self._number)
-        await self._switch.send_command(f'aoutput-vol-get{self._number}')
-        await self._switch.send_command(f'aoutput-conf-get{self._number}')
-        await self._switch.send_command(f'aoutput-mute-get{self._number}')
-        await self._switch.send_command(f'aoutput-mono-get{self._number}')
-        if self._number < 17 and self._switch._model == Model.SSA_3220D:
-            await self._switch.send_command(f'aoutput-delayboth-get{self._number}')
-    
-    async def set_volume(self, vol: int):
+        async with asyncio.timeout(timeout):
+            await self._switch._fetch_all(self._refresh_commands(scope), max_age)
+
+    async def get_volume(self, max_age: Optional[float] = None, timeout: Optional[float] = None) -> int:
+        """The volume, fetched from the switch unless it was fetched less than `max_age` seconds ago."""
+        await self._switch._read_through(f'aoutput-vol-get{self._number}', max_age, timeout)
+        return self.volume
+
+    async def get_mute(self, max_age: Optional[float] = None, timeout: Optional[float] = None) -> bool:
+        await self._switch._read_through(f'aoutput-mute-get{self._number}', max_age, timeout)
+        return self.mute
+
+    async def get_stereo(self, max_age: Optional[float] = None, timeout: Optional[float] = None) -> bool:
+        await self._switch._read_through(f'aoutput-mono-get{self._number}', max_age, timeout)
+        return self.stereo
+
+    async def get_passthru(self, max_age: Optional[float] = None, timeout: Optional[float] = None) -> bool:
+        await self._switch._read_through(f'aoutput-conf-get{self._number}', max_age, timeout)
+        return self.passthru
+
+    async def get_delay(self, max_age: Optional[float] = None, timeout: Optional[float] = None) -> tuple:
+        self._check_delay()
+        await self._switch._read_through(f'aoutput-delayboth-get{self._number}', max_age, timeout)
+        return self.delay
+    
+    def _volume_command(self, vol: int) -> str:
         if vol < -38 or vol > 0:
             raise ValueError(f'Invalid volume level: {vol}dB')
-        await self._switch.send_command(f'aoutput-vol-set{self._number}:{vol}dB')
-        pass
+        return f'aoutput-vol-set{self._number}:{vol}dB'
+
+    def _mute_command(self, mute: bool) -> str:
+        return f'aoutput-mute-set{self._number}:{"on" if mute else "off"}'
+
+    def _mono_command(self, mono: bool) -> str:
+        return f'aoutput-mono-set{self._number}:{"on" if mono else "off"}'
+
+    def _passthru_command(self, passthru: bool) -> str:
+        return f'aoutput-conf-set{self._number}:{"passthru" if passthru else "processed"}'
+
+    def _has_delay(self) -> bool:
+        # only the first 16 outputs of an SSA-3220D have a delay
+        return self._number < 17 and self._switch._model == Model.SSA_3220D
+
+    def _check_delay(self):
+        if not self._has_delay():
+            raise ValueError(f'Output {self._number} of an {self._switch._model.value} has no delay')
+
+    def _delay_commands(self, left: int, right: int) -> List[str]:
+        self._check_delay()
+        return [f'aoutput-delayleft-set{self._number}:{left}', f'aoutput-delayright-set{self._number}:{right}']
+
+    def _diff(self, settings: OutputSettings, force: bool = False) -> List[str]:
+        """Commands needed to bring this output to `settings`; unless `force`, settings already in place are skipped."""
+        # until the output has been read, the cached values are only defaults and cannot be trusted
+        force = force or not self.valid
+        commands = []
+        if settings.volume is not None and (force or settings.volume != self.volume):
+            commands.append(self._volume_command(settings.volume))
+        if settings.mute is not None and (force or settings.mute != self.mute):
+            commands.append(self._mute_command(settings.mute))
+        if settings.mono is not None and (force or settings.mono == self.stereo):
+            commands.append(self._mono_command(settings.mono))
+        if settings.passthru is not None and (force or settings.passthru != self.passthru):
+            commands.append(self._passthru_command(settings.passthru))
+        if settings.delay is not None:
+            left, right = settings.delay
+            delay_commands = self._delay_commands(left, right)
+            if force or left != self._state.delayleft[self._number]:
+                commands.append(delay_commands[0])
+            if force or right != self._state.delayright[self._number]:
+                commands.append(delay_commands[1])
+        return commands
+
+    async def set_volume(self, vol: int, timeout: Optional[float] = None):
+        await self._switch._send_coalesced(self._volume_command(vol), timeout)
     
-    async def set_mute(self, mute: bool):
-        await self._switch.send_command(f'aoutput-mute-set{self._number}:{"on" if mute else "off"}')
-        pass
+    async def set_mute(self, mute: bool, timeout: Optional[float] = None):
+        await self._switch.send_command(self._mute_command(mute), timeout)
     
-    async def set_mono(self, mono: bool):
-        await self._switch.send_command(f'aoutput-mono-set{self._number}:{"on" if mono else "off"}')
-        pass
+    async def set_mono(self, mono: bool, timeout: Optional[float] = None):
+        await self._switch.send_command(self._mono_command(mono), timeout)
     
-    async def set_passthru(self, passthru: bool):
-        await self._switch.send_command(f'aoutput-conf-set{self._number}:{"passthru" if passthru else "processed"}')
-        pass
+    async def set_passthru(self, passthru: bool, timeout: Optional[float] = None):
+        await self._switch.send_command(self._passthru_command(passthru), timeout)
     
-    async def set_delay(self, left: int, right: int):
-        await self._switch.send_command(f'aoutput-delayleft-set{self._number}:{left}')
-        await self._switch.send_command(f'aoutput-delayrighy-set{self._number}:{right}')
-        pass
+    async def set_delay(self, left: int, right: int, timeout: Optional[float] = None):
+        async with asyncio.timeout(timeout):
+            await asyncio.gather(*(self._switch._send_coalesced(command) for command in self._delay_commands(left, right)))
+
+
 
+class _Coalesced:
+    """A setting write that is waiting out the coalescing window; later writes to the same setting replace `command`."""
+
+    def __init__(self, command: str):
+        self.command = command
+        self.future = asyncio.get_running_loop().create_future()
+        self.task = None
+
+
+class _Fetch:
+    """A query being sent on behalf of `waiters` callers, at `priority`."""
+    __slots__ = ('task', 'priority', 'waiters')
+
+    def __init__(self, task: asyncio.Future, priority: Priority):
+        self.task = task
+        self.priority = priority
+        self.waiters = 0
 
 
 class Switch:
     """Class for connecting to switch
 
+    If `coalesce_window` is set, volume and delay writes to the same output are held for that many seconds, and only the
+    last value written during the window is sent; every caller's await completes once that value is acknowledged.
+
+    `timeout` is the default limit, in seconds, on each command.  Methods that take a `timeout` argument apply it to the
+    whole operation: every command the operation sends must finish before that deadline.  Without a timeout, a command
+    still fails once its connection has been lost `max_retries` times (see `Connection`).
+
+    `hooks` (see `savantaudio.metrics`) instruments the connection, plus `err` replies and the time spent parsing.
     """
 
-    def __init__(self, host: str, port: int, model = Model.SSA_3220D) -> None:
+    def __init__(self, host: str, port: int, model = Model.SSA_3220D, pipeline_depth: int = 1,
+                 coalesce_window: float = 0.0, read_timeout: float = 10.0, keepalive: Optional[float] = 30.0,
+                 timeout: Optional[float] = None, hooks: Optional[Hooks] = None,
+                 max_retries: Optional[int] = 5) -> None:
         self._host = host
         self._port = port
-        self._inputs = []
-        self._outputs = []
         self._links = {} # output -> input
-        self._callback = None
-        self._connection = Connection(self._host, self._port)
+        self._events = EventBus()
+        self._connection = Connection(self._host, self._port, pipeline_depth=pipeline_depth, handler=self._unsolicited,
+                                      read_timeout=read_timeout, keepalive=keepalive, on_reconnect=self._resync,
+                                      hooks=hooks, max_retries=max_retries)
+        self._hooks = hooks
         self._attributes = {}
+        self._fetched = {} # query command -> time.monotonic() its reply was last received
+        self._fetching = {} # query command -> _Fetch
+        self._coalesce_window = coalesce_window
+        self._timeout = timeout
+        self._coalescing = {} # setting (command up to ':') -> _Coalesced
+        self._flushing = set() # tasks sending coalesced writes, from the start of their window until answered
+        self._reconcile_task = None
         self._ready = False
         self._model = model
         if self._model == Model.SSA_3220 or self._model == Model.SSA_3220D:
@@ -277,6 +1040,11 @@ class Switch:
             self._noutputs = 20
         else:
             raise ValueError(f'Unknown model: {self._model}')
+        # port numbers start at 1, so index 0 of each state array is unused
+        self._input_state = _InputState(self._ninputs + 1)
+        self._output_state = _OutputState(self._noutputs + 1)
+        self._inputs = tuple(Input(self, num, f'Input {num}') for num in range(1, self._ninputs + 1))
+        self._outputs = tuple(Output(self, num, f'Output {num}') for num in range(1, self._noutputs + 1))
     
     @property
     def host(self):
@@ -293,158 +1061,455 @@ class Switch:
     @property
     def model(self):
         return self._model
+
+    @property
+    def connection(self) -> Connection:
+        return self._connection
     
-    async def connect(self):
+    async def connect(self, state_file: Optional[str] = None, timeout: Optional[float] = None):
+        """Connect to the switch and fetch its state, raising TimeoutError if that takes longer than `timeout` seconds.
+
+        If `state_file` names a snapshot saved by an earlier run, the state is loaded from it and this returns straight
+        away; the switch is then refreshed in the background (see `reconciled`), firing update events only for state
+        that differs from the snapshot, and the file is rewritten.  Without a snapshot this refreshes as usual, and
+        saves one to `state_file` if given.
+        """
         _LOGGER.debug("Connecting to Savant Audio Switch %s:%d", self._host, self._port)
-        await self.refresh()
+        if state_file is not None and os.path.exists(state_file):
+            try:
+                self.load_state(state_file)
+            except (OSError, ValueError) as ex:
+                _LOGGER.warning(f'Ignoring unreadable state file {state_file}: {ex}')
+            else:
+                self._reconcile_task = asyncio.create_task(self._reconcile(state_file))
+                return
+        await self.refresh(timeout=timeout)
+        if state_file is not None:
+            self.save_state(state_file)
+
+    async def _reconcile(self, state_file: str):
+        try:
+            await self.refresh()
+            self.save_state(state_file)
+        except Exception as ex:
+            _LOGGER.exception(f'Background refresh of {self._host}:{self._port} failed: {ex}', exc_info=ex)
+            raise
+
+    async def reconciled(self):
+        """Wait for the background refresh started by `connect(state_file=...)`, if any."""
+        if self._reconcile_task is not None:
+            await self._reconcile_task
+
+    async def close(self):
+        if self._reconcile_task is not None and not self._reconcile_task.done():
+            self._reconcile_task.cancel()
+        for fetch in self._fetching.values():
+            fetch.task.cancel()
+        for flushing in self._flushing:
+            flushing.cancel()
+        self._coalescing.clear()
+        self._events.close()
+        await self._connection.close()
+
+    def snapshot(self) -> dict:
+        """Return the cached state as a JSON-serialisable dict."""
+        return {
+            'model': self._model.name,
+            'ready': self._ready,
+            'attributes': self._attributes,
+            'links': {str(output): input for output, input in self._links.items()},
+            'inputs': {str(i.number): [i.trim, i.coaxial, i.valid] for i in self._inputs},
+            'outputs': {str(o.number): [o.volume, o.mute, o.stereo, o.passthru, *o.delay, o.valid] for o in self._outputs},
+        }
+
+    def restore(self, state: dict):
+        """Replace the cached state with a `snapshot`, without firing any events.
+
+        Raises ValueError, leaving the cached state as it was, if `state` is not a valid snapshot.
+        """
+        # everything is checked into copies first, so a bad snapshot cannot leave the state half loaded
+        inputs = _InputState(self._ninputs + 1)
+        inputs.copy_from(self._input_state)
+        outputs = _OutputState(self._noutputs + 1)
+        outputs.copy_from(self._output_state)
+        try:
+            model = Model[state['model']]
+            ready = bool(state['ready'])
+            attributes = dict(state['attributes'])
+            links = {self.output(int(output)).number: self.input(int(input)).number
+                     for output, input in state['links'].items()}
+            for number, (trim, coaxial, valid) in state['inputs'].items():
+                number = self.input(int(number)).number
+                inputs.trim[number], inputs.coaxial[number], inputs.valid[number] = trim, coaxial, valid
+            for number, (volume, mute, stereo, passthru, left, right, valid) in state['outputs'].items():
+                number = self.output(int(number)).number
+                outputs.volume[number], outputs.mute[number], outputs.stereo[number] = volume, mute, stereo
+                outputs.passthru[number], outputs.delayleft[number], outputs.delayright[number] = passthru, left, right
+                outputs.valid[number] = valid
+        except (KeyError, TypeError, ValueError, OverflowError, AttributeError) as ex:
+            raise ValueError(f'Invalid state snapshot: {ex!r}') from ex
+        self._model = model
+        self._ready = ready
+        self._attributes = attributes
+        self._links = links
+        self._input_state.copy_from(inputs)
+        self._output_state.copy_from(outputs)
+
+    def save_state(self, path: str):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def load_state(self, path: str):
+        with open(path) as f:
+            self.restore(json.load(f))
     
-    def add_callback(self, callback):
-        if self._callback is None:
-            self._callback = callback
-        else:
-            cb = self._callback
-            async def _cb(event: str, object):
-                await cb(event, object)
-                await callback(event, object)
-            self._callback = _cb
+    def add_callback(self, callback) -> Subscription:
+        return self.subscribe(callback)
+
+    def subscribe(self, callback, events: Optional[Iterable[str]] = None, maxsize: Optional[int] = None) -> Subscription:
+        """Call `callback(event, object)` for every event, or just those named in `events`.
+
+        Each subscriber gets its own queue of up to `maxsize` events and is called from its own task, so a slow or
+        failing subscriber never holds up the others or the command that caused the update.
+        """
+        return self._events.subscribe(callback, events, maxsize)
+
+    def unsubscribe(self, subscription: Subscription):
+        self._events.unsubscribe(subscription)
     
     def __str__(self):
         return f"{{ host: {self._host}, port: {self._port}, attributes: {self._attributes}, inputs: {self._ninputs}, outputs: {self._noutputs}, links: {self._links} }}"
     
-    async def _updated(self, event: str, object):
-        if self._callback is not None:
-            await self._callback(event, object)
+    async def _updated(self, event: str, object, changes: Sequence[Change] = ()):
+        self._events.publish(event, object, changes)
+
+    def events(self, filter: Union[None, Iterable[str], Callable[[Change], bool]] = None, maxsize: Optional[int] = None,
+               coalesce: bool = False) -> ChangeStream:
+        """Stream `Change` records (old value, new value, port, timestamp) from now on.
+
+        `filter` is a collection of event names or a predicate on `Change`.  See `ChangeStream` for the queueing and
+        `coalesce` behaviour::
+
+            async with switch.events({'link-changed'}) as changes:
+                async for change in changes:
+                    print(f'output {change.port}: {change.old} -> {change.new}')
+        """
+        return self._events.stream(filter, maxsize, coalesce)
     
-    async def send_command(self, command: str):
+    async def send_command(self, command: str, timeout: Optional[float] = None,
+                           priority: Priority = Priority.INTERACTIVE) -> List[str]:
         try:
-            _LOGGER.debug(f"send_command: command='{command}'")
-            async for reply in self._connection.send(command):
-                _LOGGER.debug(f"send_command: reply='{reply}'")
-                await self.parse(reply)
+            _LOGGER.debug("send_command: command='%s'", command)
+            replies = await self._connection.request(command, self._timeout if timeout is None else timeout, priority)
+            for reply in replies:
+                _LOGGER.debug("send_command: reply='%s'", reply)
+                if reply.startswith('err'):
+                    _LOGGER.info(f"{self._host}:{self._port} rejected {command}: {reply}")
+                    if self._hooks is not None:
+                        self._hooks.error_reply(command, reply)
+                await self._parse(reply)
+            return replies
+        except TimeoutError:
+            _LOGGER.warning(f"Timed out waiting for reply to {command}")
+            raise
         except Exception as ex:
             _LOGGER.exception(f"Got exception {ex}")
             raise
 
-    async def refresh_link(self, output: int):
-        await self.send_command(f'switch-get{output}')
+    async def _resync(self):
+        # anything could have changed while we were disconnected, and the switch does not replay it
+        if self._fetched:
+            _LOGGER.info("Resyncing %s:%d after reconnect", self._host, self._port)
+            await self.refresh(Scope.LINKS | Scope.INPUTS | Scope.OUTPUTS)
+
+    async def _unsolicited(self, reply: str):
+        _LOGGER.debug("unsolicited: reply='%s'", reply)
+        try:
+            await self._parse(reply)
+        except ValueError as ex:
+            _LOGGER.warning(f"Ignoring unsolicited reply: {ex}")
+
+    async def _parse(self, reply: str):
+        if self._hooks is None:
+            return await self.parse(reply)
+        start = time.perf_counter()
+        try:
+            return await self.parse(reply)
+        finally:
+            self._hooks.parsed(reply, time.perf_counter() - start)
+
+    async def _send_coalesced(self, command: str, timeout: Optional[float] = None):
+        if self._coalesce_window <= 0:
+            return await self.send_command(command, timeout)
+        key = command.partition(':')[0]
+        pending = self._coalescing.get(key)
+        if pending is None:
+            pending = self._coalescing[key] = _Coalesced(command)
+            pending.task = asyncio.create_task(self._flush_coalesced(key, pending))
+            self._flushing.add(pending.task)
+            pending.task.add_done_callback(self._flushing.discard)
+        else:
+            _LOGGER.debug("coalescing %s into %s", pending.command, command)
+            pending.command = command
+        # shielded so one impatient caller cannot cancel the write for everyone else
+        async with asyncio.timeout(timeout):
+            return await asyncio.shield(pending.future)
+
+    async def _flush_coalesced(self, key: str, pending: _Coalesced):
+        try:
+            await asyncio.sleep(self._coalesce_window)
+            del self._coalescing[key] # writes from here on start a new window
+            pending.future.set_result(await self.send_command(pending.command))
+        except asyncio.CancelledError:
+            # the switch was closed; fail the writers rather than reopening the connection for them
+            if not pending.future.done():
+                pending.future.set_exception(ConnectionAbortedError(f'Connection to {self._host}:{self._port} closed'))
+                pending.future.exception() # the writers may all have given up already
+            raise
+        except Exception as ex:
+            pending.future.set_exception(ex)
 
-    async def get_link(self, output: int):
-        await self.refresh_link(output)
+    def _stale(self, command: str, max_age: Optional[float]) -> bool:
+        if max_age is None or command not in self._fetched:
+            return True
+        return time.monotonic() - self._fetched[command] > max_age
+
+    async def _fetch(self, command: str, priority: Priority = Priority.POLL):
+        # concurrent fetches of the same thing share one command.  It is shielded so one caller giving up does not fail
+        # the rest, and cancelled once they all have, so an abandoned refresh stops sending.  A more urgent fetch does
+        # not join a less urgent one, which may still be queued behind a whole refresh.
+        fetch = self._fetching.get(command)
+        if fetch is None or fetch.priority > priority:
+            fetch = _Fetch(asyncio.ensure_future(self._fetch_once(command, priority)), priority)
+            self._fetching[command] = fetch
+            fetch.task.add_done_callback(lambda task: self._fetch_done(command, task))
+        fetch.waiters += 1
+        try:
+            await asyncio.shield(fetch.task)
+        finally:
+            fetch.waiters -= 1
+            if fetch.waiters == 0 and not fetch.task.done():
+                fetch.task.cancel()
+
+    async def _fetch_once(self, command: str, priority: Priority):
+        await self.send_command(command, priority=priority)
+        self._fetched[command] = time.monotonic()
+
+    def _fetch_done(self, command: str, fetching: asyncio.Future):
+        fetch = self._fetching.get(command)
+        if fetch is not None and fetch.task is fetching:
+            del self._fetching[command]
+        if not fetching.cancelled():
+            fetching.exception() # every caller may have given up, and then nobody else would look
+
+    async def _read_through(self, command: str, max_age: Optional[float], timeout: Optional[float]):
+        if self._stale(command, max_age):
+            async with asyncio.timeout(timeout):
+                await self._fetch(command, Priority.INTERACTIVE)
+
+    async def _fetch_all(self, commands: Sequence[str], max_age: Optional[float] = None,
+                         priority: Priority = Priority.POLL):
+        await asyncio.gather(*(self._fetch(command, priority) for command in commands if self._stale(command, max_age)))
+
+    async def refresh_link(self, output: int, timeout: Optional[float] = None):
+        async with asyncio.timeout(timeout):
+            await self._fetch(f'switch-get{output}')
+
+    async def get_link(self, output: int, max_age: Optional[float] = None, timeout: Optional[float] = None):
+        """The input linked to `output` (None if disconnected).
+
+        The link is fetched from the switch unless it was fetched, or reported by the switch, less than `max_age` seconds
+        ago.  Concurrent calls share one fetch.
+        """
+        await self._read_through(f'switch-get{output}', max_age, timeout)
         if output in self._links:
             return self._links[output]
         else:
             return None
 
-    async def refresh(self):
-        _LOGGER.debug("Switch.refresh %s:%d", self._host, self._port)
-        async for reply in self._connection.send('fwrev'):
-            m = re.search('fwrevPrimary; (.*)', reply)
-            if m:
-                self._attributes['fwrev'] = m.group(1)
-
-        async for reply in self._connection.send('fpga-rev'):
-            m = re.search('fpga-rev(.*)', reply)
-            if m:
-                self._attributes['fpgarev'] = m.group(1)
-        
-        async for reply in self._connection.send('status'):
-            m = re.search('statusAPI1.0; (.*)', reply)
-            if m:
-                for part in m.group(1).split(';'):
-                    part = part.strip()
-                    if part.startswith('pn'):
-                        self._attributes['pn'] = part
-                    elif part.startswith('sn'):
-                        self._attributes['sn'] = part
-                    elif part.startswith('rev'):
-                        self._attributes['rev'] = part
-                    elif part == 'ready=yes':
-                        self._ready = True
-                    elif part == 'ready=no':
-                        self._ready = False
-                    elif part == 'Standalone-Audio-Switch-With-Delay':
-                        self._model = Model.SSA_3220D
-                    elif part == 'Standalone-Audio-Switch':
-                        self._model = Model.SSA_3220
-
-
-        for c in range(1, self._noutputs):
-            await self.refresh_link(c)
-
-        for i in range(1, self._ninputs+1):
-            await self.input(i).refresh()
-
-        for o in range(1, self._noutputs+1):
-            await self.output(o).refresh()
-
-    def input(self, num: int):
-        while len(self._inputs) <= num:
-            self._inputs.append(None)
-        if self._inputs[num] is None:
-            self._inputs[num] = Input(self, num, f'Input {num}')
-        return self._inputs[num]
-
-    def output(self, num: int):
-        while len(self._outputs) <= num:
-            self._outputs.append(None)
-        if self._outputs[num] is None:
-            self._outputs[num] = Output(self, num, f'Output {num}')
-        return self._outputs[num]
+    async def refresh(self, scope: Scope = Scope.ALL, inputs: Optional[Iterable[int]] = None,
+                      outputs: Optional[Iterable[int]] = None, max_age: Optional[float] = None,
+                      timeout: Optional[float] = None, priority: Priority = Priority.POLL):
+        """Fetch state from the switch.
+
+        :param scope: which kinds of state to fetch
+        :param inputs: only fetch input state for these input numbers (default: all inputs)
+        :param outputs: only fetch link and output state for these output numbers (default: all outputs)
+        :param max_age: skip anything that was already fetched less than this many seconds ago
+        :param timeout: raise TimeoutError if the whole refresh takes longer than this many seconds
+        :param priority: scheduling class of the refresh's commands; by default they give way to everything else
+        """
+        async with asyncio.timeout(timeout):
+            await self._refresh(scope, inputs, outputs, max_age, priority)
+
+    async def _refresh(self, scope: Scope, inputs: Optional[Iterable[int]], outputs: Optional[Iterable[int]],
+                       max_age: Optional[float], priority: Priority):
+        _LOGGER.debug("Switch.refresh %s:%d %s", self._host, self._port, scope)
+        inputs = range(1, self._ninputs+1) if inputs is None else sorted(set(inputs))
+        outputs = range(1, self._noutputs+1) if outputs is None else sorted(set(outputs))
+
+        if Scope.INFO in scope:
+            # the model reported by status decides which output commands are valid, so fetch it first
+            await self._fetch_all(['fwrev', 'fpga-rev', 'status'], max_age, priority)
+
+        # everything else is independent, so let the connection pipeline it
+        commands = []
+        if Scope.LINKS in scope:
+            commands.extend(f'switch-get{o}' for o in outputs)
+        if scope & Scope.INPUTS:
+            for i in inputs:
+                commands.extend(self.input(i)._refresh_commands(scope))
+        if scope & Scope.OUTPUTS:
+            for o in outputs:
+                commands.extend(self.output(o)._refresh_commands(scope))
+        await self._fetch_all(commands, max_age, priority)
+
+    def input(self, num: int) -> Input:
+        if num < 1 or num > self._ninputs:
+            raise ValueError(f'Invalid input: {num}')
+        return self._inputs[num - 1]
+
+    def output(self, num: int) -> Output:
+        if num < 1 or num > self._noutputs:
+            raise ValueError(f'Invalid output: {num}')
+        return self._outputs[num - 1]
 
     @property
-    def inputs(self):
-        return [input for input in self._inputs if input is not None]
+    def inputs(self) -> Tuple[Input, ...]:
+        return self._inputs
 
     @property
-    def outputs(self):
-        return [output for output in self._outputs if output is not None]
+    def outputs(self) -> Tuple[Output, ...]:
+        return self._outputs
 
-    async def link(self, output: int, input: int):
-        await self.send_command(f'switch-set{output}.{input}')
+    async def link(self, output: int, input: int, timeout: Optional[float] = None):
+        await self.send_command(f'switch-set{output}.{input}', timeout)
 
-    async def unlink(self, output: int, input: int = None):
-        if input is None:
-            #unlink no matter what
-            await self.send_command(f'switch-set{output}.disconnect')
-        else:
-            link = await self.get_link(output)
-            if link is not None and link == input:
+    async def unlink(self, output: int, input: int = None, max_age: Optional[float] = None,
+                     timeout: Optional[float] = None):
+        """Disconnect `output`, or only if it is linked to `input` (judged from state up to `max_age` seconds old)."""
+        async with asyncio.timeout(timeout):
+            if input is None:
+                #unlink no matter what
                 await self.send_command(f'switch-set{output}.disconnect')
+            else:
+                link = await self.get_link(output, max_age)
+                if link is not None and link == input:
+                    await self.send_command(f'switch-set{output}.disconnect')
+
+    def diff(self, scene: Scene, force: bool = False) -> List[str]:
+        """Return the commands needed to bring the switch from its cached state to `scene`.
+
+        Links and outputs whose state has never been read from the switch are always included, as is everything if
+        `force` is set.
+        """
+        commands = []
+        for output, input in scene.links.items():
+            known = force is False and (output in self._links or f'switch-get{output}' in self._fetched)
+            if input is None or input == 0:
+                if not known or output in self._links:
+                    commands.append(f'switch-set{output}.disconnect')
+            elif not known or self._links.get(output) != input:
+                commands.append(f'switch-set{output}.{input}')
+        for output, settings in scene.outputs.items():
+            commands.extend(self.output(output)._diff(settings, force))
+        return commands
+
+    async def _scene_command(self, command: str, deadline: Optional[float],
+                             priority: Priority = Priority.SCENE) -> CommandResult:
+        try:
+            async with asyncio.timeout_at(deadline):
+                replies = await self.send_command(command, priority=priority)
+        except Exception as ex:
+            return CommandResult(command, False, error=ex)
+        return CommandResult(command, not any(reply.startswith('err') for reply in replies), replies)
+
+    async def apply_scene(self, scene: Scene, force: bool = False, timeout: Optional[float] = None) -> List[CommandResult]:
+        """Apply `scene`, sending only the commands that change something (see `diff`) and pipelining them.
+
+        Returns the result of each command sent; a failed command (including one still unanswered `timeout` seconds
+        after the scene started) does not stop the others.
+        """
+        commands = self.diff(scene, force)
+        _LOGGER.debug("apply_scene: %d commands", len(commands))
+        deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+        return list(await asyncio.gather(*(self._scene_command(command, deadline) for command in commands)))
 
-    async def link_changed(self, output: int, input: int):
+    async def link_changed(self, output: int, input: int, old: Optional[int] = None):
         _LOGGER.info(f'switch {output} connected to {input}')
-        await self._updated('link-changed', (output, input))
+        await self._updated('link-changed', (output, input), (Change('link-changed', output, 'input', old, input, time.time()),))
     
     @property
     def links(self):
         return self._links
 
-    async def parse(self, value: str):
-        if value.startswith('err'):
-            return False
-        m = re.search('(ainput|aoutput)-([a-z\-]+)(\d+):(.*)', value)
-        if m:
-            if m.group(1) == 'ainput':
-                await self.input(int(m.group(3))).parse(m.group(2), m.group(4))
-            elif m.group(1) == 'aoutput':
-                await self.output(int(m.group(3))).parse(m.group(2), m.group(4))
-            else:
-                raise ValueError(f'got unknown response: {value}')
+    async def _parse_input(self, attribute: str, index: int, value: str):
+        return await self.input(index).parse(attribute, value)
+
+    async def _parse_output(self, attribute: str, index: int, value: str):
+        return await self.output(index).parse(attribute, value)
+
+    async def _parse_link(self, attribute: str, output: int, value: str):
+        input = int(value)
+        # every switch reply (to a get or a set, or pushed) reports the link as it now is
+        self._fetched[f'switch-get{output}'] = time.monotonic()
+        old = self._links.get(output, 0)
+        if input == 0:
+            if output in self._links:
+                del self._links[output]
+                await self.link_changed(output, input, old)
         else:
-            m = re.search('switch(\d+).(\d+)', value)
-            if m:
-                output = int(m.group(1))
-                input = int(m.group(2))
-                if input == 0:
-                    if output in self._links:
-                        del self._links[output]
-                        await self.link_changed(output, input)
-                else:
-                    if output not in self._links or self._links[output] != input:
-                        self._links[output] = input
-                        await self.link_changed(output, input)
-            else:
-                raise ValueError(f'got unknown response: {value}')
+            if old != input:
+                self._links[output] = input
+                await self.link_changed(output, input, old)
+        return True
+
+    async def _parse_fwrev(self, attribute: str, index: int, value: str):
+        self._attributes['fwrev'] = value
         return True
 
+    async def _parse_fpgarev(self, attribute: str, index: int, value: str):
+        self._attributes['fpgarev'] = value
+        return True
+
+    async def _parse_status(self, attribute: str, index: int, value: str):
+        for part in value.split(';'):
+            part = part.strip()
+            if part.startswith('pn'):
+                self._attributes['pn'] = part
+            elif part.startswith('sn'):
+                self._attributes['sn'] = part
+            elif part.startswith('rev'):
+                self._attributes['rev'] = part
+            elif part == 'ready=yes':
+                self._ready = True
+            elif part == 'ready=no':
+                self._ready = False
+            elif part == 'Standalone-Audio-Switch-With-Delay':
+                self._model = Model.SSA_3220D
+            elif part == 'Standalone-Audio-Switch':
+                self._model = Model.SSA_3220
+        return True
+
+    _PARSERS = {
+        'ainput': _parse_input,
+        'aoutput': _parse_output,
+        'switch': _parse_link,
+        'fwrev': _parse_fwrev,
+        'fpga-rev': _parse_fpgarev,
+        'status': _parse_status,
+    }
 
+    async def parse(self, value: str):
+        if value.startswith('err'):
+            return False
+        token = _tokenize(value)
+        if token is None:
+            if value.startswith(('fwrev', 'status')):
+                _LOGGER.debug("ignoring %s", value) # e.g. fwrevSecondary; only the primary firmware is kept
+                return False
+            raise ValueError(f'got unknown response: {value}')
+        kind, attribute, index, argument = token
+        return await self._PARSERS[kind](self, attribute, index, argument)
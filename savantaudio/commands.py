@@ -0,0 +1,129 @@
+"""
+savantaudio.commands.py
+~~~~~~~~~~~~~~~~~~~~~~~
+
+The operations behind the command line, shared by `entry_points` and the daemon.
+"""
+
+import asyncio
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from .client import Scope, Switch
+
+# command -> number of arguments it needs after host and port
+COMMANDS = {
+    'dump': 0,
+    'link': 2,
+    'unlink': 1,
+    'set-volume': 2,
+    'get-volume': 1,
+}
+
+def link_lines(switch: Switch) -> List[str]:
+    """The link table, by port name; it needs only the links, not the state of the ports."""
+    lines = ["Links:"]
+    for output, input in sorted(switch.links.items()):
+        lines.append(f'{switch.input(input).name} => {switch.output(output).name}')
+    return lines
+
+def _check(command: str, args: Sequence[str]):
+    if command not in COMMANDS:
+        raise ValueError(f'unknown command {command}')
+    if len(args) < COMMANDS[command]:
+        raise ValueError(f'{command} needs {COMMANDS[command]} arguments after host and port')
+
+async def _perform(switch: Switch, command: str, args: Sequence[str], max_age: Optional[float]) -> List[str]:
+    """Carry out one command, returning the lines it prints other than the link table printed after link and unlink."""
+    if command == 'dump':
+        await switch.refresh(max_age=max_age)
+        return ([str(switch)] + [str(input) for input in switch.inputs] + [str(output) for output in switch.outputs]
+                + link_lines(switch))
+    if command == 'link':
+        await switch.link(int(args[0]), int(args[1]))
+        return []
+    if command == 'unlink':
+        await switch.unlink(int(args[0]), int(args[1]) if len(args) > 1 else None, max_age)
+        return []
+    output = switch.output(int(args[0]))
+    if command == 'set-volume':
+        await output.set_volume(int(args[1]))
+        await output.refresh(max_age=max_age)
+        return [str(output)]
+    return [str(await output.get_volume(max_age))]
+
+async def execute(switch: Switch, command: str, args: Sequence[str], max_age: Optional[float] = None,
+                  timeout: Optional[float] = None) -> List[str]:
+    """Run CLI `command` (e.g. 'set-volume' with args ['11', '-20']) on `switch`, returning the lines to print.
+
+    Only the state the command needs is fetched, and not even that if it was fetched less than `max_age` seconds ago.
+    Raises TimeoutError if the whole command takes longer than `timeout` seconds.
+    """
+    _check(command, args)
+    async with asyncio.timeout(timeout):
+        lines = await _perform(switch, command, args, max_age)
+        if command in ('link', 'unlink'):
+            await switch.refresh(Scope.LINKS, max_age=max_age)
+            lines = link_lines(switch)
+    return lines
+
+def parse_batch(lines: Iterable[str]) -> List[Tuple[str, List[str]]]:
+    """Parse batch input, one command and its arguments (without host and port) per line; blank lines and # comments
+    are skipped.  Raises ValueError, naming the line, for anything that is not a valid command."""
+    operations = []
+    for number, line in enumerate(lines, 1):
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        command, args = words[0], words[1:]
+        try:
+            _check(command, args)
+            for arg in args:
+                int(arg)
+        except ValueError as ex:
+            raise ValueError(f'line {number}: {ex}') from None
+        operations.append((command, args))
+    return operations
+
+async def execute_batch(switch: Switch, operations: Sequence[Tuple[str, Sequence[str]]],
+                        max_age: Optional[float] = None, timeout: Optional[float] = None) -> Tuple[List[str], int]:
+    """Run many commands on `switch` over its one connection, returning the lines to print and the number that failed.
+
+    Commands on different outputs run concurrently, so their traffic is pipelined; commands on the same output run in
+    the order given, and `dump` waits for everything before it.  The link table is printed once, at the end, if anything
+    was linked or unlinked.  Each command fails with TimeoutError if it takes longer than `timeout` seconds once the
+    commands it waits for are done.
+    """
+    async def run(after: Sequence[asyncio.Task], command: str, args: Sequence[str]) -> List[str]:
+        if after:
+            await asyncio.wait(after) # their failures are reported with them
+        async with asyncio.timeout(timeout):
+            return await _perform(switch, command, args, max_age)
+
+    tasks = []
+    chains = {} # output -> task of the last command on it
+    barrier = None # the last dump
+    for command, args in operations:
+        _check(command, args)
+        if command == 'dump':
+            task = asyncio.create_task(run(list(chains.values()) + ([barrier] if barrier else []), command, args))
+            chains.clear()
+            barrier = task
+        else:
+            output = int(args[0])
+            previous = chains.get(output, barrier)
+            task = chains[output] = asyncio.create_task(run([previous] if previous else [], command, args))
+        tasks.append(task)
+
+    lines = []
+    failures = 0
+    for (command, args), result in zip(operations, await asyncio.gather(*tasks, return_exceptions=True)):
+        if isinstance(result, Exception):
+            failures += 1
+            lines.append(f'{command} {" ".join(args)} failed: {result}')
+        else:
+            lines.extend(result)
+    if any(command in ('link', 'unlink') for command, _ in operations):
+        async with asyncio.timeout(timeout):
+            await switch.refresh(Scope.LINKS, max_age=max_age)
+        lines.extend(link_lines(switch))
+    return lines, failures
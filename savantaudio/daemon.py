@@ -0,0 +1,223 @@
+"""
+savantaudio.daemon.py
+~~~~~~~~~~~~~~~~~~~~~
+
+A long-running process that keeps connections to switches open, and their state cached, for the command line.  The CLI
+hands each command to the daemon over a Unix socket when one is running, so a one-shot command costs at most the round
+trips it actually needs rather than a new connection and a full refresh.
+
+    savantaudio-client daemon --max-age 1
+    python -m savantaudio.daemon --socket /run/savantaudio.sock
+
+Requests and responses are single lines of JSON:
+
+    {"command": "set-volume", "host": "192.168.1.50", "port": 8085, "args": ["11", "-20"]}
+    {"ok": true, "lines": ["Output_11{Stereo, Processed, volume=-20dB, delay=0/0ms}"]}
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import tempfile
+from typing import List, Optional, Sequence
+
+from .client import Switch
+from .commands import execute
+from .manager import SwitchManager
+
+_LOGGER = logging.getLogger(__name__)
+
+def _directory() -> Optional[str]:
+    # the per-user directory the default socket goes in, or None if $SAVANTAUDIO_SOCKET says where it is
+    if os.environ.get('SAVANTAUDIO_SOCKET'):
+        return None
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), f'savantaudio-{os.getuid()}')
+
+def socket_path() -> str:
+    """$SAVANTAUDIO_SOCKET, or a socket in a per-user directory in $XDG_RUNTIME_DIR (or the temp directory)."""
+    directory = _directory()
+    return os.environ['SAVANTAUDIO_SOCKET'] if directory is None else os.path.join(directory, 'daemon.sock')
+
+def check_owner(path: str):
+    """Raise PermissionError unless `path` belongs to this user, so nobody else can pose as (or remove) our daemon."""
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f'{path} belongs to another user')
+
+def _check_directory(directory: str):
+    # nobody else may be able to replace the socket between our checks and its use
+    check_owner(directory)
+    if os.stat(directory).st_mode & 0o077:
+        raise PermissionError(f'{directory} is accessible to other users')
+
+async def call(command: str, host: str, port: int, args: Sequence[str] = (), path: Optional[str] = None) -> List[str]:
+    """Run a CLI command in the daemon listening on `path`, returning the lines it prints.
+
+    Raises OSError if no daemon is listening (PermissionError if the socket belongs to another user), and RuntimeError
+    if the command failed.
+    """
+    if path is None:
+        directory = _directory()
+        if directory is not None:
+            _check_directory(directory)
+        path = socket_path()
+    check_owner(path)
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        request = {'command': command, 'host': host, 'port': int(port), 'args': list(args)}
+        writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+        line = await reader.readline()
+    finally:
+        writer.close()
+    if not line:
+        raise ConnectionResetError('daemon closed the connection')
+    response = json.loads(line)
+    if not response['ok']:
+        raise RuntimeError(response['error'])
+    return response['lines']
+
+
+class Daemon:
+    """Serves CLI commands on a Unix socket from a warm `Switch` per host:port.
+
+    A switch is connected (and fully refreshed) the first time it is named, and then kept open; it stays current from
+    the changes the switch pushes.  Commands re-read any state they need that is more than `max_age` seconds old.
+    Connecting a switch, and each command, fail with TimeoutError after `timeout` seconds.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_age: Optional[float] = 1.0, pipeline_depth: int = 8,
+                 timeout: Optional[float] = 10.0) -> None:
+        self._directory = None if path else _directory()
+        self._path = path or socket_path()
+        self._max_age = max_age
+        self._timeout = timeout
+        self._manager = SwitchManager(pipeline_depth=pipeline_depth)
+        self._switches = {} # (host, port) -> task connecting the switch, done once it is connected
+        self._server = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def manager(self) -> SwitchManager:
+        return self._manager
+
+    async def start(self):
+        if self._directory is not None:
+            try:
+                os.mkdir(self._directory, 0o700)
+            except FileExistsError:
+                _check_directory(self._directory)
+        if os.path.exists(self._path):
+            check_owner(self._path)
+            try:
+                _, writer = await asyncio.open_unix_connection(self._path)
+            except OSError:
+                os.unlink(self._path) # left behind by a daemon that died
+            else:
+                writer.close()
+                raise RuntimeError(f'a daemon is already listening on {self._path}')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177) # only this user may connect, from the moment the socket exists
+        try:
+            sock.bind(self._path)
+        except OSError:
+            sock.close()
+            raise
+        finally:
+            os.umask(umask)
+        self._server = await asyncio.start_unix_server(self._accept, sock=sock)
+        _LOGGER.info(f'Listening on {self._path}')
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+        for connecting in self._switches.values():
+            connecting.cancel()
+        self._switches.clear()
+        await self._manager.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def switch(self, host: str, port: int) -> Switch:
+        """The connected switch at host:port, connecting it if this is the first time it has been asked for."""
+        key = (host, int(port))
+        connecting = self._switches.get(key)
+        if connecting is None:
+            connecting = self._switches[key] = asyncio.ensure_future(self._connect(*key))
+        try:
+            return await asyncio.shield(connecting)
+        except Exception:
+            if self._switches.get(key) is connecting:
+                del self._switches[key] # try again next time
+            raise
+
+    async def _connect(self, host: str, port: int) -> Switch:
+        switch = self._manager.add(host, port)
+        try:
+            await switch.connect(timeout=self._timeout)
+        except Exception:
+            await self._manager.remove(host, port)
+            raise
+        return switch
+
+    async def handle(self, request: dict) -> dict:
+        try:
+            switch = await self.switch(request['host'], request['port'])
+            lines = await execute(switch, request['command'], request.get('args', ()), self._max_age, self._timeout)
+        except Exception as ex:
+            _LOGGER.debug(f'{request} failed: {ex}')
+            return {'ok': False, 'error': str(ex) or type(ex).__name__}
+        return {'ok': True, 'lines': lines}
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self.handle(json.loads(line))
+                except ValueError as ex:
+                    response = {'ok': False, 'error': f'bad request: {ex}'}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(args):
+    async with Daemon(args.socket, args.max_age, args.pipeline_depth, args.timeout):
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await stop.wait()
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Keep Savant Audio switch connections warm for the CLI')
+    parser.add_argument('--socket', default=None, help=f'Unix socket to listen on (default: {socket_path()})')
+    parser.add_argument('--max-age', type=float, default=1.0, help='seconds cached state may be used for before re-reading it')
+    parser.add_argument('--pipeline-depth', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds a command may take before it fails')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -6,18 +6,56 @@ This module contains the entry-point functions for the savantaudio module,
 that are referenced in setup.py.
 """
 
-from os import remove
 from sys import argv
 import sys
+import os
 import re
+import socket
 
 import asyncio
-import client
+from . import client, commands, daemon
 
-def print_links(switch):
-    print("Links:")
-    for output, input in switch.links.items():
-        print(f'{switch.input(input)} => {switch.output(output)}')
+PIPELINE_DEPTH = 16
+TIMEOUT = 10.0 # seconds; a switch that never answers fails the command instead of hanging it
+
+async def run(user_cmd: str, host: str, port: int, args):
+    """Run a command in the daemon if one is listening, and otherwise over a connection of our own."""
+    if hasattr(socket, 'AF_UNIX') and os.path.exists(daemon.socket_path()):
+        try:
+            return await daemon.call(user_cmd, host, port, args)
+        except OSError:
+            pass # not actually running; do it ourselves
+    # no connect(): that would fetch everything, and the command fetches just what it needs
+    switch = client.Switch(host=host, port=port, pipeline_depth=PIPELINE_DEPTH)
+    try:
+        return await commands.execute(switch, user_cmd, args, timeout=TIMEOUT)
+    finally:
+        await switch.close()
+
+async def run_batch(host: str, port: int, lines):
+    """Run the commands in `lines` (see `commands.parse_batch`) pipelined over one connection."""
+    operations = commands.parse_batch(lines)
+    switch = client.Switch(host=host, port=port, pipeline_depth=PIPELINE_DEPTH)
+    try:
+        # the switch starts empty and sees every change made over its connection, so nothing needs fetching twice
+        return await commands.execute_batch(switch, operations, max_age=float('inf'), timeout=TIMEOUT)
+    finally:
+        await switch.close()
+
+def batch(host: str, port: int, path: str = '-'):
+    if path == '-':
+        text = sys.stdin.readlines()
+    else:
+        with open(path) as f:
+            text = f.readlines()
+    try:
+        lines, failures = asyncio.run(run_batch(host, port, text))
+    except ValueError as ex: # a line that is not a valid command; nothing has been run
+        print(ex, file=sys.stderr)
+        return 1
+    for line in lines:
+        print(line)
+    return 1 if failures else None
 
 def main() -> None:
     """Main package entry point.
@@ -29,48 +67,17 @@ def main() -> None:
         user_cmd = argv[1]
         if user_cmd == 'install':
             pass
-        elif user_cmd == 'dump':
-            switch = client.Switch(host=argv[2], port=argv[3])
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(switch.connect())
-            print(str(switch))
-            for input in switch.inputs:
-                print(str(input))
-            for output in switch.outputs:
-                print(str(output))
-            print_links(switch)
-        elif user_cmd == 'link':
-            switch = client.Switch(host=argv[2], port=argv[3])
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(switch.connect())
-            loop.run_until_complete(switch.link(int(argv[4]), int(argv[5])))
-            print_links(switch)
-        elif user_cmd == 'unlink':
-            switch = client.Switch(host=argv[2], port=argv[3])
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(switch.connect())
-            loop.run_until_complete(switch.unlink(int(argv[4]), int(argv[5]) if len(argv) > 5 else None))
-            print_links(switch)
-        elif user_cmd == 'set-volume':
-            switch = client.Switch(host=argv[2], port=argv[3])
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(switch.connect())
-            loop.run_until_complete(switch.output(int(argv[4])).set_volume(int(argv[5])))
-            print(str(switch.output(int(argv[4]))))
-        elif user_cmd == 'get-volume':
-            switch = client.Switch(host=argv[2], port=argv[3])
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(switch.connect())
-            print(str(switch.output(int(argv[4])).volume))
+        elif user_cmd == 'daemon':
+            daemon.main(argv[2:])
+        elif user_cmd == 'batch':
+            return batch(argv[2], int(argv[3]), argv[4] if len(argv) > 4 else '-')
+        elif user_cmd in commands.COMMANDS:
+            for line in asyncio.run(run(user_cmd, argv[2], int(argv[3]), argv[4:])):
+                print(line)
         else:
-            RuntimeError('please supply a command for savantaudio - e.g. install.')
+            raise RuntimeError('please supply a command for savantaudio - e.g. install.')
     except IndexError:
-        RuntimeError('please supply a command for savantaudio - e.g. install.')
+        raise RuntimeError('please supply a command for savantaudio - e.g. install.')
     return None
 
 if __name__ == '__main__':
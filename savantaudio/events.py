@@ -0,0 +1,210 @@
+"""
+savantaudio.events.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Event bus used by `Switch` to deliver `input-updated`, `output-updated` and `link-changed` events to subscribers, and
+`Change` records to change streams.
+"""
+
+import asyncio
+import collections
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Optional, Union
+
+_LOGGER = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Change:
+    """One change of one attribute, e.g. Change('output-updated', 11, 'volume', -30, -20, 1700000000.0).
+
+    For `link-changed` the port is the output and the values are input numbers (0 when disconnected).
+    """
+    event: str
+    port: int
+    attribute: str
+    old: Any
+    new: Any
+    timestamp: float
+
+
+class ChangeStream:
+    """Async iterator over `Change` records published after it was opened.
+
+    Changes queue up (at most `maxsize` of them) until the consumer asks for them.  Publishing never waits for a
+    consumer, since it happens as replies are read, so there is no backpressure: a consumer that falls too far behind
+    loses the oldest changes, counted in `dropped`.  This is deliberate, so one slow consumer cannot stall the
+    connection for everyone; a consumer that must not miss anything can use `coalesce`, or re-read the state (e.g.
+    `Switch.refresh`) whenever `dropped` goes up.  With `coalesce`, changes to an attribute that have not yet been
+    consumed are merged into one record carrying the first old value and the latest new value, so the queue holds at
+    most one record per attribute.
+
+    Close the stream (or use it as an async context manager) when done with it.  Iteration ends, once the queued changes
+    have been consumed, when the stream is closed, including by `Switch.close`.
+    """
+
+    def __init__(self, bus, filter: Union[None, Iterable[str], Callable[[Change], bool]], maxsize: int, coalesce: bool):
+        self._bus = bus
+        if filter is None or callable(filter):
+            self._filter = filter
+        else:
+            events = frozenset(filter)
+            self._filter = lambda change: change.event in events
+        self._maxsize = maxsize
+        self._coalesce = coalesce
+        self._changes = collections.OrderedDict() if coalesce else collections.deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+
+    def _put(self, change: Change):
+        if self._filter is not None and not self._filter(change):
+            return
+        if self._coalesce:
+            key = (change.event, change.port, change.attribute)
+            previous = self._changes.pop(key, None)
+            if previous is not None:
+                change = Change(change.event, change.port, change.attribute, previous.old, change.new, change.timestamp)
+            elif len(self._changes) >= self._maxsize:
+                self._changes.popitem(last=False)
+                self.dropped += 1
+            self._changes[key] = change
+        else:
+            if len(self._changes) == self._maxsize:
+                self.dropped += 1
+            self._changes.append(change)
+        self._ready.set()
+
+    def _take(self) -> Change:
+        if self._coalesce:
+            return self._changes.popitem(last=False)[1]
+        return self._changes.popleft()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._bus._remove_stream(self)
+            self._ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Change:
+        while not self._changes:
+            if self._closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        return self._take()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class Subscription:
+    """A subscriber's callback plus its own bounded queue of events waiting to be delivered.
+
+    Events are delivered in order by a task of the subscription's own, so a slow or failing callback only delays (or
+    loses) its own events.  If the queue is full the oldest waiting event is dropped and counted in `dropped`.
+    """
+
+    def __init__(self, bus, callback: Callable[[str, object], Awaitable], events: Optional[Iterable[str]], maxsize: int):
+        self._bus = bus
+        self._callback = callback
+        self._events = None if events is None else frozenset(events)
+        self._queue = collections.deque(maxlen=maxsize)
+        self._task = None
+        self.dropped = 0
+
+    @property
+    def events(self):
+        return self._events
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def wants(self, event: str) -> bool:
+        return self._events is None or event in self._events
+
+    def unsubscribe(self):
+        self._bus.unsubscribe(self)
+
+    def _put(self, event: str, object):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+            _LOGGER.warning(f'Subscriber {self._callback} is falling behind; dropped {self.dropped} events')
+        self._queue.append((event, object))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._deliver())
+
+    async def _deliver(self):
+        while self._queue:
+            event, object = self._queue.popleft()
+            try:
+                await self._callback(event, object)
+            except Exception as ex:
+                _LOGGER.exception(f'Subscriber {self._callback} failed on {event}: {ex}', exc_info=ex)
+
+    def _cancel(self):
+        self._queue.clear()
+        if self._task is not None and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+
+class EventBus:
+    """Fan events out to subscribers without waiting for them; `publish` never blocks."""
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        self._maxsize = maxsize
+        self._subscriptions = ()
+        self._streams = ()
+
+    @property
+    def subscriptions(self):
+        return self._subscriptions
+
+    def subscribe(self, callback: Callable[[str, object], Awaitable], events: Optional[Iterable[str]] = None,
+                  maxsize: Optional[int] = None) -> Subscription:
+        """Call `callback(event, object)` for each published event, or only those named in `events`."""
+        subscription = Subscription(self, callback, events, maxsize or self._maxsize)
+        self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscriptions:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+        subscription._cancel()
+
+    def stream(self, filter: Union[None, Iterable[str], Callable[[Change], bool]] = None, maxsize: Optional[int] = None,
+               coalesce: bool = False) -> ChangeStream:
+        """Open a `ChangeStream` of changes matching `filter` (event names, or a predicate on `Change`)."""
+        stream = ChangeStream(self, filter, maxsize or self._maxsize, coalesce)
+        self._streams = self._streams + (stream,)
+        return stream
+
+    def close(self):
+        """Close every stream, and drop the events still waiting for subscribers.
+
+        Subscriptions stay registered, and get whatever is published from now on.
+        """
+        for stream in self._streams:
+            stream.close()
+        for subscription in self._subscriptions:
+            subscription._cancel()
+
+    def _remove_stream(self, stream: ChangeStream):
+        self._streams = tuple(s for s in self._streams if s is not stream)
+
+    def publish(self, event: str, object, changes: Iterable[Change] = ()):
+        """Deliver `(event, object)` to subscribers and `changes` to streams."""
+        for subscription in self._subscriptions:
+            if subscription.wants(event):
+                subscription._put(event, object)
+        if self._streams:
+            for change in changes:
+                for stream in self._streams:
+                    stream._put(change)
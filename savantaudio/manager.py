@@ -0,0 +1,126 @@
+"""
+savantaudio.manager.py
+~~~~~~~~~~~~~~~~~~~~~~
+
+Manage many Savant Audio switches from one event loop.
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+
+from .client import Model, Scope, Switch
+
+_LOGGER = logging.getLogger(__name__)
+
+class SwitchManager:
+    """Owns a set of `Switch` instances, one per host:port.
+
+    Each switch keeps its connection open between operations, so repeated refreshes reuse it.  Bulk operations run
+    concurrently across switches, with at most `concurrency` switches being worked on at once.  Events from every switch
+    are merged: callbacks added with `add_callback` are called as `callback(switch, event, object)`, and `events()`
+    yields `(switch, event, object)` tuples.
+    """
+
+    def __init__(self, concurrency: int = 8, pipeline_depth: int = 1) -> None:
+        self._switches = {} # (host, port) -> Switch
+        self._concurrency = asyncio.Semaphore(concurrency)
+        self._pipeline_depth = pipeline_depth
+        self._callbacks = []
+        self._queues = set()
+
+    @property
+    def switches(self) -> Tuple[Switch, ...]:
+        return tuple(self._switches.values())
+
+    def __len__(self):
+        return len(self._switches)
+
+    def __iter__(self):
+        return iter(self._switches.values())
+
+    def get(self, host: str, port: int) -> Optional[Switch]:
+        return self._switches.get((host, int(port)))
+
+    def add(self, host: str, port: int, model = Model.SSA_3220D, **kwargs) -> Switch:
+        """Return the switch for host:port, creating it if necessary."""
+        key = (host, int(port))
+        switch = self._switches.get(key)
+        if switch is None:
+            kwargs.setdefault('pipeline_depth', self._pipeline_depth)
+            switch = Switch(host, int(port), model, **kwargs)
+            async def _cb(event: str, object):
+                await self._updated(switch, event, object)
+            switch.add_callback(_cb)
+            self._switches[key] = switch
+        return switch
+
+    async def remove(self, host: str, port: int):
+        switch = self._switches.pop((host, int(port)), None)
+        if switch is not None:
+            await switch.close()
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    async def _updated(self, switch: Switch, event: str, object):
+        for queue in self._queues:
+            queue.put_nowait((switch, event, object))
+        for callback in self._callbacks:
+            await callback(switch, event, object)
+
+    async def events(self) -> AsyncIterator[Tuple[Switch, str, object]]:
+        """Yield `(switch, event, object)` for every update on any managed switch, from now on."""
+        queue = asyncio.Queue()
+        self._queues.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues.discard(queue)
+
+    async def _run(self, switch: Switch, operation):
+        async with self._concurrency:
+            await operation(switch)
+
+    async def _all(self, operation, switches: Optional[Iterable[Switch]] = None) -> Dict[Switch, Exception]:
+        switches = list(self._switches.values() if switches is None else switches)
+        results = await asyncio.gather(*(self._run(switch, operation) for switch in switches), return_exceptions=True)
+        failures = {}
+        for switch, result in zip(switches, results):
+            if isinstance(result, Exception):
+                _LOGGER.warning(f'{switch.host}:{switch.port} failed: {result}')
+                failures[switch] = result
+        return failures
+
+    async def connect(self, switches: Optional[Iterable[Switch]] = None) -> Dict[Switch, Exception]:
+        """Connect to (and fully refresh) the switches concurrently, returning the failures by switch."""
+        return await self._all(lambda switch: switch.connect(), switches)
+
+    async def refresh(self, scope: Scope = Scope.ALL, switches: Optional[Iterable[Switch]] = None,
+                      **kwargs) -> Dict[Switch, Exception]:
+        """Refresh the switches concurrently (see `Switch.refresh`), returning the failures by switch."""
+        return await self._all(lambda switch: switch.refresh(scope, **kwargs), switches)
+
+    async def close(self):
+        await asyncio.gather(*(switch.close() for switch in self._switches.values()), return_exceptions=True)
+
+    @property
+    def links(self) -> Dict[Tuple[str, int], Dict[int, int]]:
+        """Links of every switch, keyed by (host, port)."""
+        return {key: dict(switch.links) for key, switch in self._switches.items()}
+
+    @property
+    def state(self) -> Dict[Tuple[str, int], dict]:
+        """Cached state of every switch, keyed by (host, port)."""
+        return {
+            key: {
+                'attributes': dict(switch.attributes),
+                'links': dict(switch.links),
+                'inputs': {input.number: {'trim': input.trim, 'coaxial': input.coaxial} for input in switch.inputs},
+                'outputs': {output.number: {'volume': output.volume, 'mute': output.mute, 'stereo': output.stereo,
+                                            'passthru': output.passthru, 'delay': tuple(output.delay)}
+                            for output in switch.outputs},
+            }
+            for key, switch in self._switches.items()
+        }
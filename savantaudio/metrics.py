@@ -0,0 +1,172 @@
+"""
+savantaudio.metrics.py
+~~~~~~~~~~~~~~~~~~~~~~
+
+Instrumentation hooks for the command path, and `Metrics`, an in-memory implementation of them.
+"""
+
+import bisect
+import re
+from typing import Any, Dict, Optional, Sequence
+
+_COMMAND_TYPE = re.compile(r'[a-z]+(?:-[a-z]+)*')
+
+def command_type(command: str) -> str:
+    """The command without its port numbers and arguments, e.g. 'aoutput-vol-set' for 'aoutput-vol-set3:-20dB'."""
+    m = _COMMAND_TYPE.match(command)
+    return command if m is None else m.group(0)
+
+
+class Hooks:
+    """Callbacks made as commands go through a `Connection` and their replies through `Switch`.
+
+    Every method does nothing; override the ones you need, e.g. to feed Prometheus or OpenTelemetry, and pass an
+    instance as `hooks` to `Switch` (or `Connection`).  Hooks are called from the event loop and must not block.
+    """
+
+    def command_started(self, command: str) -> Any:
+        """`command` is about to be queued.  Whatever this returns (a tracing span, say) is passed to `command_finished`."""
+        return None
+
+    def command_finished(self, command: str, context: Any, latency: float, error: Optional[BaseException]):
+        """`command` got its reply (`error` is None), failed, timed out or was cancelled, `latency` seconds after it started."""
+
+    def lock_waited(self, seconds: float):
+        """A command waited `seconds` for the connection's write lock."""
+
+    def in_flight_changed(self, count: int):
+        """The number of commands written but not yet answered changed to `count`."""
+
+    def data_sent(self, count: int):
+        """`count` bytes were written to the socket."""
+
+    def data_received(self, count: int):
+        """`count` bytes were read from the socket."""
+
+    def retried(self, command: str, error: BaseException):
+        """`command` is being re-sent because the connection failed with `error` before it was answered."""
+
+    def error_reply(self, command: str, reply: str):
+        """The switch answered `command` with `reply`, an `err` line."""
+
+    def parsed(self, reply: str, seconds: float):
+        """Parsing `reply` and updating the cached state took `seconds`."""
+
+
+# seconds; roughly logarithmic from a LAN round trip up to the default timeouts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Counts of observations per bucket, where bucket i holds values up to `buckets[i]` (and the last, anything larger)."""
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile (infinity if it is past the last bucket)."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self) -> dict:
+        """Cumulative bucket counts keyed by upper bound, Prometheus style, plus count and sum."""
+        cumulative = {}
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            cumulative['+Inf' if bound == float('inf') else str(bound)] = total
+        return {'buckets': cumulative, 'count': self.count, 'sum': self.sum}
+
+
+class Metrics(Hooks):
+    """Hooks that keep counters and latency histograms in memory; `snapshot()` returns them all.
+
+    Latencies are kept per command type (see `command_type`), so e.g. every `aoutput-vol-set` shares one histogram.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._buckets = tuple(buckets)
+        self.latency = {} # command type -> Histogram
+        self.commands = {} # command type -> count
+        self.errors = {} # command type -> count of failed commands (other than timeouts)
+        self.timeouts = {} # command type -> count
+        self.error_replies = {} # command type -> count of `err` replies
+        self.retries = 0
+        self.lock_wait = Histogram(self._buckets)
+        self.parse_time = Histogram(self._buckets)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _histogram(self, kind: str) -> Histogram:
+        histogram = self.latency.get(kind)
+        if histogram is None:
+            histogram = self.latency[kind] = Histogram(self._buckets)
+        return histogram
+
+    def command_finished(self, command: str, context: Any, latency: float, error: Optional[BaseException]):
+        kind = command_type(command)
+        self.commands[kind] = self.commands.get(kind, 0) + 1
+        if error is None:
+            self._histogram(kind).observe(latency)
+        elif isinstance(error, TimeoutError):
+            self.timeouts[kind] = self.timeouts.get(kind, 0) + 1
+        else:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def lock_waited(self, seconds: float):
+        self.lock_wait.observe(seconds)
+
+    def in_flight_changed(self, count: int):
+        self.in_flight = count
+        if count > self.max_in_flight:
+            self.max_in_flight = count
+
+    def data_sent(self, count: int):
+        self.bytes_sent += count
+
+    def data_received(self, count: int):
+        self.bytes_received += count
+
+    def retried(self, command: str, error: BaseException):
+        self.retries += 1
+
+    def error_reply(self, command: str, reply: str):
+        kind = command_type(command)
+        self.error_replies[kind] = self.error_replies.get(kind, 0) + 1
+
+    def parsed(self, reply: str, seconds: float):
+        self.parse_time.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything collected so far, as plain data (suitable for `json.dump`)."""
+        return {
+            'commands': dict(self.commands),
+            'latency': {kind: histogram.as_dict() for kind, histogram in self.latency.items()},
+            'errors': dict(self.errors),
+            'timeouts': dict(self.timeouts),
+            'error_replies': dict(self.error_replies),
+            'retries': self.retries,
+            'lock_wait': self.lock_wait.as_dict(),
+            'parse_time': self.parse_time.as_dict(),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+        }
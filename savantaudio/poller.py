@@ -0,0 +1,181 @@
+"""
+savantaudio.poller.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Background polling that keeps a `Switch`'s cached state fresh without full refresh sweeps.
+"""
+
+import asyncio
+import heapq
+import logging
+from typing import Dict, Optional
+
+from .client import Scope, Switch
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_INTERVALS = {
+    Scope.LINKS: 10.0,
+    Scope.OUTPUT_VOLUME: 10.0,
+    Scope.OUTPUT_MUTE: 30.0,
+    Scope.INPUT_TRIM: 120.0,
+}
+
+class TokenBucket:
+    """Allows `rate` operations per second on average, in bursts of up to `rate` (or one, if `rate` is less than one)."""
+
+    def __init__(self, rate: float) -> None:
+        self._rate = rate
+        self._capacity = max(1.0, rate)
+        self._tokens = self._capacity
+        self._refilled = None
+
+    async def take(self):
+        """Wait for a token."""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self._refilled is not None:
+                self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * self._rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class Poller:
+    """Refresh a switch one attribute at a time, each on its own interval.
+
+    `intervals` maps a single `Scope` flag (links, or one input/output attribute) to how often, in seconds, each port's
+    value should be re-read.  Outputs that changed within the last `active_window` seconds are polled every
+    `active_interval` seconds instead.  No more than `rate` commands per second are sent.  If a poll takes longer than
+    `slow_latency` (or fails), every interval is stretched, doubling up to `max_backoff` times, and it shrinks back as
+    the switch recovers.
+    """
+
+    def __init__(self, switch: Switch, intervals: Optional[Dict[Scope, float]] = None, rate: float = 5.0,
+                 active_interval: float = 1.0, active_window: float = 30.0, slow_latency: float = 0.5,
+                 max_backoff: float = 8.0) -> None:
+        self._switch = switch
+        self._intervals = dict(DEFAULT_INTERVALS if intervals is None else intervals)
+        self._bucket = TokenBucket(rate)
+        self._active_interval = active_interval
+        self._active_window = active_window
+        self._slow_latency = slow_latency
+        self._max_backoff = max_backoff
+        self._backoff = 1.0
+        self._active = {} # output -> loop time of its last change
+        self._due = {} # (scope, port) -> loop time it is next due
+        self._heap = [] # (due, scope value, port) - entries that no longer match _due are stale
+        self._wakeup = asyncio.Event()
+        self._subscription = None
+        self._task = None
+        self.polls = 0
+        self.failures = 0
+
+    @property
+    def backoff(self) -> float:
+        return self._backoff
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        for scope, interval in self._intervals.items():
+            ports = range(1, self._switch._ninputs + 1) if scope & Scope.INPUTS else range(1, self._switch._noutputs + 1)
+            for port in ports:
+                # spread the first round over one interval rather than polling everything at once
+                self._schedule(scope, port, now + interval * (port - 1) / len(ports))
+        self._subscription = self._switch.subscribe(self._changed, ('output-updated', 'link-changed'))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._subscription is not None:
+            self._switch.unsubscribe(self._subscription)
+            self._subscription = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._due.clear()
+        self._heap.clear()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def _schedule(self, scope: Scope, port: int, due: float):
+        self._due[(scope, port)] = due
+        heapq.heappush(self._heap, (due, scope.value, port))
+
+    def _interval(self, scope: Scope, port: int, now: float) -> float:
+        interval = self._intervals[scope]
+        if scope & (Scope.LINKS | Scope.OUTPUTS) and now - self._active.get(port, -self._active_window) < self._active_window:
+            interval = min(interval, self._active_interval)
+        return interval * self._backoff
+
+    async def _changed(self, event: str, object):
+        output = object[0] if event == 'link-changed' else object.number
+        now = asyncio.get_running_loop().time()
+        self._active[output] = now
+        # bring the output's next polls forward so the faster rate applies straight away
+        for scope in self._intervals:
+            if scope & (Scope.LINKS | Scope.OUTPUTS):
+                due = self._due.get((scope, output))
+                if due is not None and due > now + self._active_interval:
+                    self._schedule(scope, output, now + self._active_interval)
+        self._wakeup.set()
+
+    async def _poll(self, scope: Scope, port: int):
+        if scope == Scope.LINKS:
+            await self._switch.refresh_link(port)
+        elif scope & Scope.INPUTS:
+            await self._switch.input(port).refresh(scope)
+        else:
+            await self._switch.output(port).refresh(scope)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._heap:
+            due, scope, port = self._heap[0]
+            scope = Scope(scope)
+            if self._due.get((scope, port)) != due:
+                heapq.heappop(self._heap) # superseded by a later _schedule
+                continue
+            now = loop.time()
+            if due > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            await self._bucket.take()
+            start = loop.time()
+            try:
+                await self._poll(scope, port)
+                slow = loop.time() - start > self._slow_latency
+            except Exception as ex:
+                _LOGGER.warning(f'Polling {scope} {port} on {self._switch.host}:{self._switch.port} failed: {ex}')
+                self.failures += 1
+                slow = True
+            self.polls += 1
+            if slow:
+                self._backoff = min(self._max_backoff, self._backoff * 2)
+            else:
+                self._backoff = max(1.0, self._backoff * 0.9)
+            now = loop.time()
+            self._schedule(scope, port, now + self._interval(scope, port, now))
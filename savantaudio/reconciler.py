@@ -0,0 +1,185 @@
+"""
+savantaudio.reconciler.py
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Keeps a switch at a declared desired state, correcting only what has drifted.
+"""
+
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from .client import CommandResult, OutputSettings, Priority, Scene, Scope, Switch
+from .metrics import command_type
+from .poller import TokenBucket
+
+_LOGGER = logging.getLogger(__name__)
+
+def _scope(settings: OutputSettings) -> Scope:
+    """The output state `settings` depends on."""
+    scope = Scope(0)
+    if settings.volume is not None:
+        scope |= Scope.OUTPUT_VOLUME
+    if settings.mute is not None:
+        scope |= Scope.OUTPUT_MUTE
+    if settings.mono is not None:
+        scope |= Scope.OUTPUT_MONO
+    if settings.passthru is not None:
+        scope |= Scope.OUTPUT_CONF
+    if settings.delay is not None:
+        scope |= Scope.OUTPUT_DELAY
+    return scope
+
+
+class Reconciler:
+    """Hold a switch at `scene`, its desired links and output settings.
+
+    Every `interval` seconds the links and output attributes the scene covers are re-read (unless read less than
+    `max_age` seconds ago), compared with the scene using `Switch.diff`, and only the commands for what has drifted are
+    sent, at no more than `rate` per second.  A change pushed by the switch that moves a covered port away from the
+    scene brings the next pass forward, `settle` seconds after the change, using the cached state.
+
+    Drift is counted per command type (e.g. `aoutput-vol-set`) in `drift`; `stats` summarises it all.
+    """
+
+    def __init__(self, switch: Switch, scene: Scene, interval: float = 30.0, max_age: Optional[float] = None,
+                 rate: float = 5.0, settle: float = 0.5) -> None:
+        self._switch = switch
+        self._scene = scene
+        self._interval = interval
+        self._max_age = max_age
+        self._bucket = TokenBucket(rate)
+        self._settle = settle
+        self._wakeup = asyncio.Event()
+        self._subscription = None
+        self._task = None
+        self.passes = 0
+        self.drift = {} # command type -> number of drifted settings found
+        self.corrected = 0
+        self.failed = 0
+        self.last_drift = None # time.time() drift was last found
+        self.in_sync = False
+
+    @property
+    def scene(self) -> Scene:
+        return self._scene
+
+    @scene.setter
+    def scene(self, scene: Scene):
+        """Change the desired state; the switch is brought to it on the next pass, which starts straight away."""
+        self._scene = scene
+        self._wakeup.set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'passes': self.passes,
+            'in_sync': self.in_sync,
+            'drift': dict(self.drift),
+            'corrected': self.corrected,
+            'failed': self.failed,
+            'last_drift': self.last_drift,
+        }
+
+    def start(self):
+        if self.running:
+            return
+        self._subscription = self._switch.subscribe(self._changed, ('output-updated', 'link-changed'))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._subscription is not None:
+            self._switch.unsubscribe(self._subscription)
+            self._subscription = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def refresh(self, max_age: Optional[float] = None):
+        """Read the state the scene covers, skipping anything read less than `max_age` seconds ago."""
+        scene = self._scene
+        reads = []
+        if scene.links:
+            reads.append(self._switch.refresh(Scope.LINKS, outputs=scene.links, max_age=max_age))
+        for output, settings in scene.outputs.items():
+            scope = _scope(settings)
+            if scope and not self._switch.output(output).valid:
+                scope |= Scope.OUTPUT_VOLUME # an output counts as unread, and is always corrected, until this is read
+            if scope:
+                reads.append(self._switch.output(output).refresh(scope, max_age))
+        await asyncio.gather(*reads)
+
+    async def reconcile(self, refresh: bool = True) -> List[CommandResult]:
+        """One pass: read the covered state (if `refresh`), then correct whatever differs from the scene."""
+        if refresh:
+            await self.refresh(self._max_age)
+        commands = self._switch.diff(self._scene)
+        self.passes += 1
+        if not commands:
+            self.in_sync = True
+            return []
+        self.last_drift = time.time()
+        for command in commands:
+            kind = command_type(command)
+            self.drift[kind] = self.drift.get(kind, 0) + 1
+        _LOGGER.info(f'{self._switch.host}:{self._switch.port} drifted: correcting {len(commands)} settings')
+        results = await asyncio.gather(*(self._correct(command) for command in commands))
+        failed = sum(1 for result in results if not result.ok)
+        self.corrected += len(results) - failed
+        self.failed += failed
+        self.in_sync = failed == 0
+        return list(results)
+
+    async def _correct(self, command: str) -> CommandResult:
+        await self._bucket.take()
+        try:
+            replies = await self._switch.send_command(command, priority=Priority.SCENE)
+        except Exception as ex:
+            return CommandResult(command, False, error=ex)
+        return CommandResult(command, not any(reply.startswith('err') for reply in replies), replies)
+
+    def _drifted(self, output: int) -> bool:
+        scene = self._scene
+        if output not in scene.links and output not in scene.outputs:
+            return False
+        links = {output: scene.links[output]} if output in scene.links else {}
+        outputs = {output: scene.outputs[output]} if output in scene.outputs else {}
+        return bool(self._switch.diff(Scene(links, outputs)))
+
+    async def _changed(self, event: str, object):
+        output = object[0] if event == 'link-changed' else object.number
+        if self._drifted(output):
+            self._wakeup.set()
+
+    async def _run(self):
+        refresh = True
+        while True:
+            try:
+                await self.reconcile(refresh)
+            except Exception as ex:
+                _LOGGER.warning(f'Reconciling {self._switch.host}:{self._switch.port} failed: {ex}')
+                self.in_sync = False
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._interval)
+            except asyncio.TimeoutError:
+                refresh = True
+            else:
+                await asyncio.sleep(self._settle) # let a burst of changes land first
+                refresh = False # the switch just told us what changed
@@ -0,0 +1,307 @@
+"""
+savantaudio.simulator.py
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+A local stand-in for a Savant Audio switch, speaking the same line protocol over TCP.  Useful for tests and benchmarks
+when no hardware is available.  Network conditions can be simulated with `latency`, `jitter`, `drop_rate` and
+`reset_rate`.
+
+    python -m savantaudio.simulator --port 8085 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+from typing import List, Optional
+
+from .client import Model
+
+_LOGGER = logging.getLogger(__name__)
+
+class _SimulatedConnection:
+    """One client connection: replies are queued with a due time and written in order by a writer task."""
+
+    def __init__(self, simulator, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._simulator = simulator
+        self._reader = reader
+        self._writer = writer
+        self._queue = asyncio.Queue()
+        self._due = 0.0
+
+    def send(self, lines: List[str]):
+        loop = asyncio.get_running_loop()
+        delay = self._simulator.latency + self._simulator._random.uniform(-self._simulator.jitter, self._simulator.jitter)
+        # replies never overtake each other, however the jitter falls
+        self._due = max(self._due, loop.time() + max(0.0, delay))
+        self._queue.put_nowait((self._due, ''.join(f'{line}\r\n' for line in lines).encode('ASCII') + b'\r\n'))
+
+    def reset(self):
+        self._writer.transport.abort()
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due, data = await self._queue.get()
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+            self._writer.write(data)
+            await self._writer.drain()
+
+    async def run(self):
+        writer_task = asyncio.create_task(self._write_loop())
+        try:
+            while True:
+                data = await self._reader.readline()
+                if not data:
+                    break
+                command = data.decode('ASCII').strip()
+                if len(command) == 0:
+                    continue
+                self._simulator._received(self, command)
+        except ConnectionError:
+            pass
+        finally:
+            writer_task.cancel()
+            self._writer.close()
+
+
+class Simulator:
+    """Simulated SSA-3220/SSA-3220D switch.
+
+    :param latency: seconds between a command arriving and its reply being written
+    :param jitter: reply delays vary uniformly by up to this many seconds either way
+    :param drop_rate: probability that a command gets no reply at all
+    :param reset_rate: probability that a command causes the connection to be reset instead of answered
+    :param broadcast: whether changes made by one client are pushed to the other connected clients
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, model = Model.SSA_3220D, latency: float = 0.0,
+                 jitter: float = 0.0, drop_rate: float = 0.0, reset_rate: float = 0.0, broadcast: bool = True,
+                 seed: Optional[int] = None) -> None:
+        self._host = host
+        self._port = port
+        self._model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.reset_rate = reset_rate
+        self.broadcast = broadcast
+        self._random = random.Random(seed)
+        self._server = None
+        self._connections = {} # _SimulatedConnection -> handler task
+        self.commands = 0 # commands received, across all connections
+        self._ninputs = 32
+        self._noutputs = 20
+        self.trim = [0] * (self._ninputs + 1)
+        self.coaxial = [True] * (self._ninputs + 1)
+        self.links = [0] * (self._noutputs + 1) # 0 == disconnected
+        self.volume = [0] * (self._noutputs + 1)
+        self.mute = [False] * (self._noutputs + 1)
+        self.passthru = [False] * (self._noutputs + 1)
+        self.mono = [False] * (self._noutputs + 1)
+        self.delay = [[0, 0] for _ in range(self._noutputs + 1)]
+
+    @property
+    def host(self) -> str:
+        return self._host
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    @property
+    def connections(self) -> int:
+        return len(self._connections)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._accept, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+        _LOGGER.debug(f'Simulator listening on {self._host}:{self._port}')
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            tasks = list(self._connections.values())
+            self.reset_connections()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def reset_connections(self):
+        """Drop every client connection, as a switch reboot or network fault would."""
+        for connection in list(self._connections):
+            connection.reset()
+
+    def push(self, *lines: str):
+        """Send unsolicited lines to every connected client."""
+        for connection in list(self._connections):
+            connection.send(list(lines))
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = _SimulatedConnection(self, reader, writer)
+        self._connections[connection] = asyncio.current_task()
+        try:
+            await connection.run()
+        finally:
+            del self._connections[connection]
+
+    def _received(self, connection: _SimulatedConnection, command: str):
+        self.commands += 1
+        if self.reset_rate > 0 and self._random.random() < self.reset_rate:
+            _LOGGER.debug(f'Simulator resetting connection on {command}')
+            connection.reset()
+            return
+        lines, changed = self.execute(command)
+        if self.drop_rate > 0 and self._random.random() < self.drop_rate:
+            _LOGGER.debug(f'Simulator dropping reply to {command}')
+        else:
+            connection.send(lines)
+        if changed and self.broadcast:
+            for other in list(self._connections):
+                if other is not connection:
+                    other.send(lines)
+
+    def _has_delay(self, output: int) -> bool:
+        return self._model == Model.SSA_3220D and output < 17
+
+    def execute(self, command: str):
+        """Apply `command` to the simulated state, returning the reply lines and whether any state changed."""
+        try:
+            return self._execute(command)
+        except (ValueError, IndexError):
+            return ['err'], False
+
+    def _execute(self, command: str):
+        if command == 'fwrev':
+            return ['fwrevPrimary; 1.0.0'], False
+        if command == 'fpga-rev':
+            return ['fpga-rev1.0'], False
+        if command == 'status':
+            kind = 'Standalone-Audio-Switch-With-Delay' if self._model == Model.SSA_3220D else 'Standalone-Audio-Switch'
+            return [f'statusAPI1.0; pn{self._model.value}; sn0000000; rev1; ready=yes; {kind}'], False
+        if command.startswith('switch-get'):
+            output = self._output(command[len('switch-get'):])
+            return [f'switch{output}.{self.links[output]}'], False
+        if command.startswith('switch-set'):
+            output, _, input = command[len('switch-set'):].partition('.')
+            output = self._output(output)
+            self.links[output] = 0 if input == 'disconnect' else self._input(input)
+            return [f'switch{output}.{self.links[output]}'], True
+        if command.startswith('ainput-'):
+            return self._execute_input(command[len('ainput-'):])
+        if command.startswith('aoutput-'):
+            return self._execute_output(command[len('aoutput-'):])
+        return ['err'], False
+
+    def _input(self, number: str) -> int:
+        number = int(number)
+        if number < 1 or number > self._ninputs:
+            raise ValueError(number)
+        return number
+
+    def _output(self, number: str) -> int:
+        number = int(number)
+        if number < 1 or number > self._noutputs:
+            raise ValueError(number)
+        return number
+
+    @staticmethod
+    def _split(command: str):
+        """'vol-set11:-20dB' -> ('vol', 'set', '11', '-20dB')"""
+        attribute, _, rest = command.partition('-')
+        operation, rest = rest[:3], rest[3:]
+        number, _, value = rest.partition(':')
+        return attribute, operation, number, value
+
+    @staticmethod
+    def _number(value: str, unit: str) -> int:
+        return int(value[:-len(unit)] if value.endswith(unit) else value)
+
+    @staticmethod
+    def _choice(value: str, true: str, false: str) -> bool:
+        if value not in (true, false):
+            raise ValueError(value)
+        return value == true
+
+    def _execute_input(self, command: str):
+        attribute, operation, number, value = self._split(command)
+        input = self._input(number)
+        if operation not in ('get', 'set'):
+            return ['err'], False
+        setting = operation == 'set'
+        if attribute == 'trim':
+            if setting:
+                self.trim[input] = self._number(value, 'dB')
+            return [f'ainput-trim{input}:{self.trim[input]}dB'], setting
+        if attribute == 'conf':
+            if setting:
+                self.coaxial[input] = self._choice(value, 'coaxial', 'toslink')
+            return [f'ainput-conf{input}:{"coaxial" if self.coaxial[input] else "toslink"}'], setting
+        return ['err'], False
+
+    def _execute_output(self, command: str):
+        attribute, operation, number, value = self._split(command)
+        output = self._output(number)
+        if operation not in ('get', 'set'):
+            return ['err'], False
+        setting = operation == 'set'
+        if attribute == 'vol':
+            if setting:
+                volume = self._number(value, 'dB')
+                if volume < -38 or volume > 0:
+                    return ['err'], False
+                self.volume[output] = volume
+            return [f'aoutput-vol{output}:{self.volume[output]}dB'], setting
+        if attribute == 'mute':
+            if setting:
+                self.mute[output] = self._choice(value, 'on', 'off')
+            return [f'aoutput-mute{output}:{"on" if self.mute[output] else "off"}'], setting
+        if attribute == 'mono':
+            if setting:
+                self.mono[output] = self._choice(value, 'on', 'off')
+            return [f'aoutput-mono{output}:{"on" if self.mono[output] else "off"}'], setting
+        if attribute == 'conf':
+            if setting:
+                self.passthru[output] = self._choice(value, 'passthru', 'processed')
+            return [f'aoutput-conf{output}:{"passthru" if self.passthru[output] else "processed"}'], setting
+        if attribute in ('delayleft', 'delayright', 'delayboth') and self._has_delay(output):
+            sides = {'delayleft': (0,), 'delayright': (1,), 'delayboth': (0, 1)}[attribute]
+            if setting:
+                for side in sides:
+                    self.delay[output][side] = self._number(value, 'ms')
+            names = ('delayleft', 'delayright')
+            return [f'aoutput-{names[side]}{output}:{self.delay[output][side]}ms' for side in sides], setting
+        return ['err'], False
+
+
+async def _serve(args):
+    async with Simulator(host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+                         drop_rate=args.drop_rate, reset_rate=args.reset_rate, seed=args.seed) as simulator:
+        print(f'Simulating {simulator._model.value} on {simulator.host}:{simulator.port}')
+        await asyncio.Event().wait()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Simulated Savant Audio switch')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--latency', type=float, default=0.0, help='reply delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='reply delay variation in seconds')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='probability of not answering a command')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='probability of resetting the connection')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
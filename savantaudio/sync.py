@@ -0,0 +1,256 @@
+"""
+savantaudio.sync.py
+~~~~~~~~~~~~~~~~~~~
+
+A blocking, thread-safe front end to `Switch` for synchronous code.  One event loop runs in a background thread and
+owns the connection; any number of threads can call into it at once and share that one connection and its cached state.
+
+    switch = SyncSwitch('192.168.1.50', 8085)
+    switch.connect()
+    switch.link(11, 8)
+    switch.output(11).set_volume(-20)
+    future = switch.output(11).get_volume_future(max_age=1.0)   # concurrent.futures.Future
+    switch.close()
+
+Every coroutine method of `Switch`, `Input` and `Output` has a blocking counterpart of the same name, and a `_future`
+variant that returns a `concurrent.futures.Future` straight away.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Callable, Coroutine, Dict, Optional, Tuple
+
+from .client import Model, Switch
+
+_LOGGER = logging.getLogger(__name__)
+
+class LoopThread:
+    """An event loop running in a daemon thread, which other threads can hand coroutines and calls to."""
+
+    def __init__(self, name: str = 'savantaudio') -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+
+    def _check_thread(self):
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('blocking call made from the event loop thread; await the coroutine instead')
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule `coro` on the loop and return a future for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run `coro` on the loop and wait (at most `timeout` seconds) for its result."""
+        self._check_thread()
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def call(self, function: Callable, *args) -> Any:
+        """Call `function(*args)` on the loop thread and wait for its result, e.g. to read state consistently."""
+        self._check_thread()
+        async def _call():
+            return function(*args)
+        return self.run(_call())
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            if threading.current_thread() is not self._thread:
+                self._thread.join()
+
+
+def _blocking(name: str):
+    def method(self, *args, **kwargs):
+        self._thread._check_thread() # before making a coroutine that would never be awaited
+        return self._thread.run(getattr(self._target, name)(*args, **kwargs))
+    def future(self, *args, **kwargs) -> concurrent.futures.Future:
+        return self._thread.submit(getattr(self._target, name)(*args, **kwargs))
+    method.__name__ = name
+    future.__name__ = f'{name}_future'
+    method.__doc__ = f'Blocking `{name}`.'
+    future.__doc__ = f'`{name}` as a concurrent.futures.Future.'
+    return method, future
+
+def _add_blocking(cls, names: Tuple[str, ...]):
+    for name in names:
+        method, future = _blocking(name)
+        setattr(cls, name, method)
+        setattr(cls, f'{name}_future', future)
+    return cls
+
+
+class _SyncPort:
+    __slots__ = ('_thread', '_target')
+
+    def __init__(self, thread: LoopThread, target) -> None:
+        self._thread = thread
+        self._target = target
+
+    @property
+    def number(self) -> int:
+        return self._target.number
+
+    def __str__(self):
+        return self._thread.call(str, self._target)
+
+
+class SyncInput(_SyncPort):
+    __slots__ = ()
+
+    @property
+    def trim(self) -> int:
+        return self._target.trim
+
+    @property
+    def coaxial(self) -> bool:
+        return self._target.coaxial
+
+_add_blocking(SyncInput, ('refresh', 'set_trim', 'set_coaxial', 'get_trim', 'get_coaxial'))
+
+
+class SyncOutput(_SyncPort):
+    __slots__ = ()
+
+    @property
+    def volume(self) -> int:
+        return self._target.volume
+
+    @property
+    def mute(self) -> bool:
+        return self._target.mute
+
+    @property
+    def stereo(self) -> bool:
+        return self._target.stereo
+
+    @property
+    def passthru(self) -> bool:
+        return self._target.passthru
+
+    @property
+    def delay(self) -> tuple:
+        return self._target.delay
+
+_add_blocking(SyncOutput, ('refresh', 'set_volume', 'set_mute', 'set_mono', 'set_passthru', 'set_delay',
+                           'get_volume', 'get_mute', 'get_stereo', 'get_passthru', 'get_delay'))
+
+
+class SyncSwitch:
+    """Blocking wrapper around a `Switch` whose connection lives on a `LoopThread`.
+
+    Pass `thread` to share one loop thread between several switches; otherwise the switch starts its own and stops it on
+    `close()`.  Other keyword arguments go to `Switch`.  Callbacks added with `add_callback` are plain functions called on
+    the loop thread, so they must return quickly.
+    """
+
+    def __init__(self, host: str, port: int, model = Model.SSA_3220D, thread: Optional[LoopThread] = None,
+                 **kwargs) -> None:
+        self._owns_thread = thread is None
+        self._thread = LoopThread() if thread is None else thread
+        async def _create():
+            return Switch(host, port, model, **kwargs)
+        self._target = self._thread.run(_create())
+        self._inputs = tuple(SyncInput(self._thread, input) for input in self._target.inputs)
+        self._outputs = tuple(SyncOutput(self._thread, output) for output in self._target.outputs)
+
+    @property
+    def switch(self) -> Switch:
+        """The underlying `Switch`; only use it from the loop thread."""
+        return self._target
+
+    @property
+    def thread(self) -> LoopThread:
+        return self._thread
+
+    @property
+    def host(self) -> str:
+        return self._target.host
+
+    @property
+    def port(self) -> int:
+        return self._target.port
+
+    @property
+    def links(self) -> Dict[int, int]:
+        return self._thread.call(dict, self._target.links)
+
+    @property
+    def attributes(self) -> dict:
+        return self._thread.call(dict, self._target.attributes)
+
+    def input(self, num: int) -> SyncInput:
+        self._target.input(num) # range check
+        return self._inputs[num - 1]
+
+    def output(self, num: int) -> SyncOutput:
+        self._target.output(num) # range check
+        return self._outputs[num - 1]
+
+    @property
+    def inputs(self) -> Tuple[SyncInput, ...]:
+        return self._inputs
+
+    @property
+    def outputs(self) -> Tuple[SyncOutput, ...]:
+        return self._outputs
+
+    def diff(self, scene, force: bool = False):
+        return self._thread.call(self._target.diff, scene, force)
+
+    def snapshot(self) -> dict:
+        return self._thread.call(self._target.snapshot)
+
+    def restore(self, state: dict):
+        return self._thread.call(self._target.restore, state)
+
+    def save_state(self, path: str):
+        return self._thread.call(self._target.save_state, path)
+
+    def load_state(self, path: str):
+        return self._thread.call(self._target.load_state, path)
+
+    def add_callback(self, callback: Callable[[str, object], None]):
+        async def _cb(event: str, object):
+            callback(event, object)
+        return self._thread.call(self._target.subscribe, _cb)
+
+    def close(self):
+        if self._thread.running:
+            self._thread.run(self._target.close())
+            if self._owns_thread:
+                self._thread.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __str__(self):
+        return self._thread.call(str, self._target)
+
+_add_blocking(SyncSwitch, ('connect', 'refresh', 'refresh_link', 'get_link', 'link', 'unlink', 'apply_scene',
+                           'send_command', 'reconciled'))
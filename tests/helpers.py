@@ -0,0 +1,29 @@
+"""
+tests.helpers
+~~~~~~~~~~~~~
+
+Shared fixtures for tests that run against the simulator.
+"""
+
+import unittest
+
+from savantaudio.client import Switch
+from savantaudio.simulator import Simulator
+
+
+class SimulatorTestCase(unittest.IsolatedAsyncioTestCase):
+    """Starts a simulator for each test; `switch()` makes switches connected to it, closed when the test ends."""
+
+    simulator_options = {}
+
+    async def asyncSetUp(self):
+        self.simulator = Simulator(seed=1, **self.simulator_options)
+        await self.simulator.start()
+
+    async def asyncTearDown(self):
+        await self.simulator.close()
+
+    def switch(self, **kwargs) -> Switch:
+        switch = Switch(self.simulator.host, self.simulator.port, **kwargs)
+        self.addAsyncCleanup(switch.close)
+        return switch
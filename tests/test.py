@@ -1,17 +1,33 @@
 import logging
 import asyncio
+import os
 import savantaudio.client
+import savantaudio.simulator
 
 logging.basicConfig(handlers=[logging.StreamHandler()], encoding='utf-8', level=logging.INFO)
 savantaudio.client._LOGGER.setLevel(logging.DEBUG)
-switch = savantaudio.client.Switch(host='192.168.1.216', port=8085)
+
+# set SAVANT_HOST (and optionally SAVANT_PORT) to run against a real switch instead of the simulator
+host = os.environ.get('SAVANT_HOST')
+port = int(os.environ.get('SAVANT_PORT', 8085))
 
 loop = asyncio.new_event_loop()
 asyncio.set_event_loop(loop)
+simulator = None
+if host is None:
+    simulator = savantaudio.simulator.Simulator(latency=0.005)
+    loop.run_until_complete(simulator.start())
+    host, port = simulator.host, simulator.port
+
+switch = savantaudio.client.Switch(host=host, port=port)
 loop.run_until_complete(switch.refresh())
 print(str(switch))
 loop.run_until_complete(switch.link(11, 8))
 loop.run_until_complete(switch.output(11).set_volume(-20))
 print(str(switch.output(11)))
 loop.run_until_complete(switch.unlink(11))
-print(str(switch.output(11)))
\ No newline at end of file
+print(str(switch.output(11)))
+loop.run_until_complete(switch.close())
+
+if simulator is not None:
+    loop.run_until_complete(simulator.close())
@@ -0,0 +1,61 @@
+"""
+tests.test_cache
+~~~~~~~~~~~~~~~~
+
+Read-through getters and their `max_age`.
+"""
+
+import asyncio
+import unittest
+
+from savantaudio.client import Scope
+
+from .helpers import SimulatorTestCase
+
+
+class TestReadThrough(SimulatorTestCase):
+
+    async def test_fresh_value_is_not_fetched_again(self):
+        switch = self.switch()
+        self.simulator.volume[1] = -9
+        self.assertEqual(await switch.output(1).get_volume(max_age=10), -9)
+        self.simulator.volume[1] = -3 # changed behind the switch's back
+        self.assertEqual(await switch.output(1).get_volume(max_age=10), -9)
+        self.assertEqual(self.simulator.commands, 1)
+        self.assertEqual(await switch.output(1).get_volume(), -3)
+        self.assertEqual(self.simulator.commands, 2)
+
+    async def test_stale_value_is_fetched_again(self):
+        switch = self.switch()
+        await switch.output(1).get_mute(max_age=0.05)
+        await asyncio.sleep(0.1)
+        self.simulator.mute[1] = True
+        self.assertTrue(await switch.output(1).get_mute(max_age=0.05))
+        self.assertEqual(self.simulator.commands, 2)
+
+    async def test_link_reply_counts_as_a_fetch(self):
+        switch = self.switch()
+        await switch.link(4, 2)
+        self.assertEqual(await switch.get_link(4, max_age=10), 2)
+        self.assertEqual(self.simulator.commands, 1)
+
+    async def test_refresh_skips_fresh_values(self):
+        switch = self.switch()
+        await switch.output(1).get_volume()
+        sent = self.simulator.commands
+        await switch.refresh(Scope.OUTPUT_VOLUME, outputs=[1, 2], max_age=10)
+        self.assertEqual(self.simulator.commands, sent + 1)
+
+    async def test_shared_fetch_survives_one_caller_giving_up(self):
+        switch = self.switch()
+        self.simulator.volume[1] = -9
+        impatient = asyncio.create_task(switch.output(1).get_volume())
+        patient = asyncio.create_task(switch.output(1).get_volume())
+        await asyncio.sleep(0)
+        impatient.cancel()
+        self.assertEqual(await patient, -9)
+        self.assertEqual(self.simulator.commands, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
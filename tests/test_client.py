@@ -0,0 +1,95 @@
+"""
+tests.test_client
+~~~~~~~~~~~~~~~~~
+
+`Connection` and `Switch` against the simulator.
+"""
+
+import asyncio
+import unittest
+
+from savantaudio.simulator import Simulator
+
+from .helpers import SimulatorTestCase
+
+
+class TestPipelining(SimulatorTestCase):
+    simulator_options = {'latency': 0.005, 'jitter': 0.005}
+
+    async def test_replies_match_commands(self):
+        switch = self.switch(pipeline_depth=8)
+        for output in range(1, 21):
+            self.simulator.volume[output] = -output
+        commands = [f'aoutput-vol-get{output}' for output in range(1, 21)] * 3
+        replies = await asyncio.gather(*(switch.send_command(command) for command in commands))
+        for command, reply in zip(commands, replies):
+            output = int(command[len('aoutput-vol-get'):])
+            self.assertEqual(reply, [f'aoutput-vol{output}:-{output}dB'])
+        self.assertEqual([output.volume for output in switch.outputs], [-output for output in range(1, 21)])
+
+    async def test_multi_line_reply(self):
+        switch = self.switch(pipeline_depth=4)
+        self.simulator.delay[3] = [5, 7]
+        replies, _ = await asyncio.gather(switch.send_command('aoutput-delayboth-get3'), switch.send_command('fwrev'))
+        self.assertEqual(replies, ['aoutput-delayleft3:5ms', 'aoutput-delayright3:7ms'])
+        self.assertEqual(switch.output(3).delay, (5, 7))
+
+    async def test_pushed_lines_are_routed_to_the_handler(self):
+        switch = self.switch(pipeline_depth=4)
+        await switch.connection.connect()
+        self.simulator.push('switch5.6') # arrives while nothing is outstanding
+        first = asyncio.create_task(switch.send_command('aoutput-vol-get1'))
+        await asyncio.sleep(0.001)
+        self.simulator.push('aoutput-mute2:on') # arrives while the next command is outstanding
+        second = asyncio.create_task(switch.send_command('aoutput-vol-get2'))
+        self.assertEqual(await first, ['aoutput-vol1:0dB'])
+        self.assertEqual(await second, ['aoutput-vol2:0dB'])
+        await asyncio.sleep(0.05)
+        self.assertEqual(switch.links, {5: 6})
+        self.assertTrue(switch.output(2).mute)
+
+
+class TestRetries(SimulatorTestCase):
+
+    async def test_reset_connections_are_retried(self):
+        self.simulator.reset_rate = 0.2
+        switch = self.switch(pipeline_depth=4)
+        await asyncio.gather(*(switch.output(output).set_volume(-output) for output in range(1, 21)))
+        self.assertEqual(self.simulator.volume[1:], [-output for output in range(1, 21)])
+        self.assertGreater(switch.connection.reconnects, 0)
+
+    async def test_dropped_replies_are_retried(self):
+        self.simulator.drop_rate = 0.2
+        switch = self.switch(pipeline_depth=4, read_timeout=0.1, keepalive=None)
+        await asyncio.gather(*(switch.output(output).set_mute(True) for output in range(1, 11)))
+        self.assertEqual(self.simulator.mute[1:11], [True] * 10)
+        self.assertGreater(switch.connection.reconnects, 0)
+
+    async def test_retries_are_limited(self):
+        self.simulator.drop_rate = 1.0 # accepts connections but never answers
+        switch = self.switch(read_timeout=0.05, keepalive=None, max_retries=2)
+        async with asyncio.timeout(5):
+            with self.assertRaises(ConnectionResetError):
+                await switch.output(1).get_volume()
+        self.assertEqual(self.simulator.commands, 3)
+
+    async def test_failed_connect_keeps_reconnecting(self):
+        switch = self.switch()
+        await switch.link(1, 2)
+        port = self.simulator.port
+        await self.simulator.close()
+        await asyncio.sleep(0.05)
+        with self.assertRaises(OSError):
+            await switch.link(1, 3)
+        self.assertGreater(switch.connection.stats['downtime'], 0)
+        self.simulator = Simulator(port=port)
+        await self.simulator.start()
+        async with asyncio.timeout(5):
+            while not switch.connection.connected:
+                await asyncio.sleep(0.01)
+        await switch.close()
+        self.assertGreater(switch.connection.downtime, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
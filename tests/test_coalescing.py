@@ -0,0 +1,38 @@
+"""
+tests.test_coalescing
+~~~~~~~~~~~~~~~~~~~~~
+
+Write coalescing.
+"""
+
+import asyncio
+import unittest
+
+from .helpers import SimulatorTestCase
+
+
+class TestCoalescing(SimulatorTestCase):
+
+    async def test_only_the_last_write_is_sent(self):
+        switch = self.switch(coalesce_window=0.02)
+        output = switch.output(3)
+        await asyncio.gather(output.set_volume(-5), output.set_volume(-6), output.set_volume(-7))
+        self.assertEqual(self.simulator.commands, 1)
+        self.assertEqual(self.simulator.volume[3], -7)
+        self.assertEqual(output.volume, -7)
+
+    async def test_close_fails_pending_writes(self):
+        switch = self.switch(coalesce_window=0.05)
+        await switch.link(1, 2)
+        write = asyncio.create_task(switch.output(1).set_volume(-5))
+        await asyncio.sleep(0.01)
+        await switch.close()
+        with self.assertRaises(ConnectionAbortedError):
+            await write
+        await asyncio.sleep(0.1)
+        self.assertFalse(switch.connection.connected)
+        self.assertEqual(self.simulator.commands, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
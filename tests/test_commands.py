@@ -0,0 +1,99 @@
+"""
+tests.test_commands
+~~~~~~~~~~~~~~~~~~~
+
+The CLI operations, checked for what they print and for what they send to the simulator.
+"""
+
+import collections
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from savantaudio import commands, entry_points
+from savantaudio.client import Scope
+
+from .helpers import SimulatorTestCase
+
+
+class TestCommands(SimulatorTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.sent = collections.Counter()
+        execute = self.simulator.execute
+        def record(command):
+            self.sent[command.rstrip('0123456789.:-dB')] += 1 # just the command type
+            return execute(command)
+        self.simulator.execute = record
+
+    async def execute(self, command, *args, max_age=None, warm=False):
+        switch = self.switch()
+        if warm:
+            await switch.refresh()
+            self.sent.clear()
+        return await commands.execute(switch, command, args, max_age)
+
+    async def test_get_volume(self):
+        self.simulator.volume[11] = -30
+        self.assertEqual(await self.execute('get-volume', '11'), ['-30'])
+        self.assertEqual(self.sent, {'aoutput-vol-get': 1})
+
+    async def test_set_volume(self):
+        lines = await self.execute('set-volume', '11', '-20')
+        self.assertEqual(lines, ['Output_11{Stereo, Processed, volume=-20dB, delay=0/0ms}'])
+        self.assertEqual(self.sent['aoutput-vol-set'], 1)
+        self.assertEqual(sum(self.sent.values()), 1 + len(Scope.OUTPUTS)) # and the output it prints
+        self.assertEqual(self.simulator.volume[11], -20)
+
+    async def test_link(self):
+        self.simulator.links[5] = 2
+        self.assertEqual(await self.execute('link', '11', '3'), ['Links:', 'Input 2 => Output 5', 'Input 3 => Output 11'])
+        # the links for the table, but none of the ports' state
+        self.assertEqual(self.sent, {'switch-set': 1, 'switch-get': 20})
+
+    async def test_unlink(self):
+        self.simulator.links[11] = 3
+        self.assertEqual(await self.execute('unlink', '11'), ['Links:'])
+        self.assertEqual(self.sent, {'switch-set11.disconnect': 1, 'switch-get': 20})
+        self.assertEqual(self.simulator.links[11], 0)
+
+    async def test_unlink_other_input(self):
+        self.simulator.links[11] = 3
+        self.assertEqual(await self.execute('unlink', '11', '4', max_age=10), ['Links:', 'Input 3 => Output 11'])
+        self.assertEqual(self.sent, {'switch-get': 20}) # no switch-set, and output 11 is not read twice
+        self.assertEqual(self.simulator.links[11], 3)
+
+    async def test_dump(self):
+        self.simulator.links[11] = 3
+        lines = await self.execute('dump')
+        self.assertEqual(lines[-2:], ['Links:', 'Input 3 => Output 11'])
+        self.assertEqual(self.sent['switch-get'], 20)
+        self.assertEqual(self.sent['aoutput-vol-get'], 20)
+
+    async def test_warm_switch_sends_only_the_change(self):
+        for command, args in (('link', ('11', '3')), ('unlink', ('11',)), ('set-volume', ('11', '-20')),
+                              ('get-volume', ('11',))):
+            with self.subTest(command=command):
+                self.sent.clear()
+                await self.execute(command, *args, max_age=10, warm=True)
+                self.assertEqual(sum(self.sent.values()), 0 if command == 'get-volume' else 1)
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_invalid_line_is_reported(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('link 11 3\nset-volume 11 loud\n')
+        self.addCleanup(os.unlink, f.name)
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            # nothing is sent, so no switch need be listening
+            self.assertEqual(entry_points.batch('127.0.0.1', 1, f.name), 1)
+        self.assertEqual(stderr.getvalue(), "line 2: invalid literal for int() with base 10: 'loud'\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
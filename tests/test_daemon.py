@@ -0,0 +1,98 @@
+"""
+tests.test_daemon
+~~~~~~~~~~~~~~~~~
+
+The CLI daemon and `call`, over a real Unix socket to a daemon talking to the simulator.
+"""
+
+import os
+import socket
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from savantaudio import daemon
+from savantaudio.daemon import Daemon, call
+
+from .helpers import SimulatorTestCase
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'needs Unix sockets')
+class TestDaemon(SimulatorTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'daemon.sock')
+
+    async def daemon(self, path=None) -> Daemon:
+        server = Daemon(path, max_age=None, timeout=5)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        return server
+
+    async def test_round_trip(self):
+        await self.daemon(self.path)
+        self.simulator.volume[11] = -30
+        host, port = self.simulator.host, self.simulator.port
+        self.assertEqual(await call('get-volume', host, port, ['11'], path=self.path), ['-30'])
+        lines = await call('set-volume', host, port, ['11', '-20'], path=self.path)
+        self.assertIn('volume=-20dB', lines[0])
+        self.assertEqual(self.simulator.volume[11], -20)
+
+    async def test_error_response(self):
+        await self.daemon(self.path)
+        with self.assertRaisesRegex(RuntimeError, 'unknown command'):
+            await call('explode', self.simulator.host, self.simulator.port, path=self.path)
+        with self.assertRaisesRegex(RuntimeError, 'needs 2 arguments'):
+            await call('link', self.simulator.host, self.simulator.port, ['11'], path=self.path)
+
+    async def test_only_this_user_may_connect(self):
+        await self.daemon(self.path)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    async def test_stale_socket_is_taken_over(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close() # the file stays, with nobody listening
+        await self.daemon(self.path)
+        self.assertEqual(await call('get-volume', self.simulator.host, self.simulator.port, ['1'], path=self.path), ['0'])
+
+    async def test_live_socket_is_not_taken_over(self):
+        await self.daemon(self.path)
+        with self.assertRaisesRegex(RuntimeError, 'already listening'):
+            await Daemon(self.path).start()
+
+    async def test_other_users_socket_is_left_alone(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+            with self.assertRaises(PermissionError):
+                await Daemon(self.path).start()
+        self.assertTrue(os.path.exists(self.path))
+
+    async def test_other_users_daemon_is_not_called(self):
+        await self.daemon(self.path)
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+            with self.assertRaises(PermissionError):
+                await call('get-volume', self.simulator.host, self.simulator.port, ['1'], path=self.path)
+        self.assertEqual(self.simulator.commands, 0)
+
+    async def test_default_socket_is_in_a_private_directory(self):
+        with mock.patch.dict(os.environ, {'XDG_RUNTIME_DIR': self.directory}):
+            os.environ.pop('SAVANTAUDIO_SOCKET', None)
+            server = await self.daemon()
+            self.assertEqual(os.path.dirname(server.path), os.path.join(self.directory, f'savantaudio-{os.getuid()}'))
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(server.path)).st_mode), 0o700)
+            self.assertEqual(await call('get-volume', self.simulator.host, self.simulator.port, ['1']), ['0'])
+            os.chmod(os.path.dirname(server.path), 0o755)
+            with self.assertRaises(PermissionError):
+                await call('get-volume', self.simulator.host, self.simulator.port, ['1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
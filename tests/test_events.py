@@ -0,0 +1,193 @@
+"""
+tests.test_events
+~~~~~~~~~~~~~~~~~
+
+Event subscriptions and change streams.
+"""
+
+import asyncio
+import logging
+import unittest
+
+from savantaudio.events import Change, EventBus
+
+from .helpers import SimulatorTestCase
+
+
+def _change(port: int, old, new, attribute: str = 'volume', event: str = 'output-updated') -> Change:
+    return Change(event, port, attribute, old, new, 0.0)
+
+
+class TestSubscriptions(unittest.IsolatedAsyncioTestCase):
+
+    async def test_unsubscribe_stops_delivery(self):
+        bus = EventBus()
+        received = []
+        async def callback(event, object):
+            received.append(object)
+        subscription = bus.subscribe(callback)
+        bus.publish('output-updated', 1)
+        await asyncio.sleep(0)
+        bus.unsubscribe(subscription)
+        bus.publish('output-updated', 2)
+        await asyncio.sleep(0.01)
+        self.assertEqual(received, [1])
+        self.assertEqual(bus.subscriptions, ())
+
+    async def test_events_filter(self):
+        bus = EventBus()
+        received = []
+        async def callback(event, object):
+            received.append(event)
+        bus.subscribe(callback, ('link-changed',))
+        bus.publish('output-updated', 1)
+        bus.publish('link-changed', (1, 2))
+        bus.publish('input-updated', 3)
+        await asyncio.sleep(0.01)
+        self.assertEqual(received, ['link-changed'])
+
+    async def test_slow_or_failing_subscriber_does_not_hold_up_others(self):
+        bus = EventBus()
+        release = asyncio.Event()
+        fast = []
+        async def slow(event, object):
+            await release.wait()
+        async def failing(event, object):
+            raise RuntimeError('subscriber bug')
+        async def quick(event, object):
+            fast.append(object)
+        slow_subscription = bus.subscribe(slow)
+        bus.subscribe(failing)
+        bus.subscribe(quick)
+        with self.assertLogs('savantaudio.events', logging.ERROR):
+            for n in range(3):
+                bus.publish('output-updated', n) # never blocks
+            await asyncio.sleep(0.01)
+        self.assertEqual(fast, [0, 1, 2])
+        self.assertEqual(slow_subscription.pending, 2)
+        release.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(slow_subscription.pending, 0)
+
+    async def test_full_queue_drops_the_oldest(self):
+        bus = EventBus()
+        release = asyncio.Event()
+        received = []
+        async def slow(event, object):
+            await release.wait()
+            received.append(object)
+        subscription = bus.subscribe(slow, maxsize=3)
+        bus.publish('output-updated', 0)
+        await asyncio.sleep(0) # 0 is being delivered, so no longer queued
+        with self.assertLogs('savantaudio.events', logging.WARNING):
+            for n in range(1, 6):
+                bus.publish('output-updated', n)
+        self.assertEqual(subscription.dropped, 2)
+        release.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(received, [0, 3, 4, 5])
+
+
+class TestStreams(unittest.IsolatedAsyncioTestCase):
+
+    async def _drain(self, stream):
+        stream.close()
+        return [change async for change in stream]
+
+    async def test_filter(self):
+        bus = EventBus()
+        by_name = bus.stream({'link-changed'})
+        by_predicate = bus.stream(lambda change: change.port == 2)
+        bus.publish('output-updated', None, [_change(1, 0, -5), _change(2, 0, -6)])
+        bus.publish('link-changed', None, [_change(3, 0, 4, 'input', 'link-changed')])
+        self.assertEqual([change.port for change in await self._drain(by_name)], [3])
+        self.assertEqual([change.new for change in await self._drain(by_predicate)], [-6])
+
+    async def test_coalesce(self):
+        bus = EventBus()
+        stream = bus.stream(coalesce=True)
+        for old, new in ((0, -5), (-5, -6), (-6, -7)):
+            bus.publish('output-updated', None, [_change(1, old, new)])
+        bus.publish('output-updated', None, [_change(1, False, True, 'mute')])
+        changes = await self._drain(stream)
+        self.assertEqual([(change.attribute, change.old, change.new) for change in changes],
+                         [('volume', 0, -7), ('mute', False, True)])
+        self.assertEqual(stream.dropped, 0)
+
+    async def test_dropped(self):
+        bus = EventBus()
+        stream = bus.stream(maxsize=3)
+        coalesced = bus.stream(maxsize=2, coalesce=True)
+        for port in range(1, 6):
+            bus.publish('output-updated', None, [_change(port, 0, -port)])
+        self.assertEqual([change.port for change in await self._drain(stream)], [3, 4, 5])
+        self.assertEqual(stream.dropped, 2)
+        self.assertEqual([change.port for change in await self._drain(coalesced)], [4, 5])
+        self.assertEqual(coalesced.dropped, 3)
+
+    async def test_close_ends_iteration(self):
+        bus = EventBus()
+        stream = bus.stream()
+        received = []
+        async def consume():
+            async with stream:
+                async for change in stream:
+                    received.append(change.new)
+        consumer = asyncio.create_task(consume())
+        bus.publish('output-updated', None, [_change(1, 0, -1)])
+        await asyncio.sleep(0)
+        bus.close()
+        async with asyncio.timeout(1):
+            await consumer
+        self.assertEqual(received, [-1])
+        bus.publish('output-updated', None, [_change(1, -1, -2)]) # nowhere to go
+        self.assertEqual(received, [-1])
+
+
+class TestSwitchEvents(SimulatorTestCase):
+
+    async def test_slow_subscriber_does_not_delay_commands(self):
+        switch = self.switch()
+        release = asyncio.Event()
+        async def slow(event, object):
+            await release.wait()
+        switch.subscribe(slow)
+        async with asyncio.timeout(1):
+            for output in range(1, 6):
+                await switch.link(output, output)
+        self.assertEqual(switch.links, {output: output for output in range(1, 6)})
+        release.set()
+
+    async def test_close_ends_streams(self):
+        switch = self.switch()
+        changes = []
+        async def consume():
+            async with switch.events({'link-changed'}) as stream:
+                async for change in stream:
+                    changes.append((change.port, change.new))
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        await switch.link(1, 2)
+        await switch.close()
+        async with asyncio.timeout(1):
+            await consumer
+        self.assertEqual(changes, [(1, 2)])
+
+    async def test_close_stops_delivery(self):
+        switch = self.switch()
+        started = asyncio.Event()
+        async def stuck(event, object):
+            started.set()
+            await asyncio.Event().wait()
+        subscription = switch.subscribe(stuck)
+        await switch.link(1, 2)
+        await switch.link(2, 3)
+        await started.wait()
+        await switch.close()
+        await asyncio.sleep(0)
+        self.assertTrue(subscription._task.done())
+        self.assertEqual(subscription.pending, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+tests.test_metrics
+~~~~~~~~~~~~~~~~~~
+
+`Metrics` hooks fed by a `Switch` talking to the simulator.
+"""
+
+import asyncio
+import json
+import unittest
+
+from savantaudio.metrics import Histogram, Metrics, command_type
+
+from .helpers import SimulatorTestCase
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantiles_and_buckets(self):
+        histogram = Histogram((0.01, 0.1, 1.0))
+        for value in (0.005, 0.05, 0.05, 5.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+        self.assertEqual(histogram.as_dict()['buckets'], {'0.01': 1, '0.1': 3, '1.0': 3, '+Inf': 4})
+
+    def test_command_type(self):
+        self.assertEqual(command_type('aoutput-vol-set3:-20dB'), 'aoutput-vol-set')
+        self.assertEqual(command_type('switch-set5.6'), 'switch-set')
+
+
+class TestMetrics(SimulatorTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.metrics = Metrics()
+
+    async def test_commands_and_bytes(self):
+        switch = self.switch(hooks=self.metrics)
+        await switch.send_command('aoutput-vol-get1')
+        await switch.send_command('aoutput-vol-get2')
+        self.assertEqual(self.metrics.commands, {'aoutput-vol-get': 2})
+        self.assertEqual(self.metrics.latency['aoutput-vol-get'].count, 2)
+        self.assertEqual(self.metrics.bytes_sent, len(b'aoutput-vol-get1\r\n') * 2)
+        # each reply ends with a blank line
+        self.assertEqual(self.metrics.bytes_received, len(b'aoutput-vol1:0dB\r\n\r\n') * 2)
+        self.assertEqual(self.metrics.parse_time.count, 2)
+        self.assertEqual(self.metrics.in_flight, 0)
+
+    async def test_error_replies(self):
+        switch = self.switch(hooks=self.metrics)
+        self.assertEqual(await switch.send_command('aoutput-bogus1'), ['err'])
+        self.assertEqual(self.metrics.error_replies, {'aoutput-bogus': 1})
+        self.assertEqual(self.metrics.errors, {})
+
+    async def test_timeouts(self):
+        switch = self.switch(hooks=self.metrics)
+        self.simulator.latency = 0.2
+        with self.assertRaises(TimeoutError):
+            await switch.send_command('aoutput-vol-get1', timeout=0.05)
+        self.assertEqual(self.metrics.timeouts, {'aoutput-vol-get': 1})
+        self.assertNotIn('aoutput-vol-get', self.metrics.latency)
+
+    async def test_retries(self):
+        self.simulator.reset_rate = 0.1
+        switch = self.switch(hooks=self.metrics, pipeline_depth=4)
+        await asyncio.gather(*(switch.output(output).set_mute(True) for output in range(1, 21)))
+        self.assertGreater(self.metrics.retries, 0)
+        self.assertEqual(self.metrics.commands, {'aoutput-mute-set': 20})
+
+    async def test_max_in_flight(self):
+        self.simulator.latency = 0.01
+        switch = self.switch(hooks=self.metrics, pipeline_depth=4)
+        await asyncio.gather(*(switch.send_command(f'aoutput-vol-get{output}') for output in range(1, 11)))
+        self.assertEqual(self.metrics.max_in_flight, 4)
+        self.assertEqual(self.metrics.in_flight, 0)
+
+    async def test_snapshot_is_json(self):
+        switch = self.switch(hooks=self.metrics)
+        await switch.send_command('aoutput-vol-get1')
+        await switch.send_command('aoutput-bogus1')
+        snapshot = json.loads(json.dumps(self.metrics.snapshot()))
+        self.assertEqual(snapshot['commands'], {'aoutput-vol-get': 1, 'aoutput-bogus': 1})
+        self.assertEqual(snapshot['latency']['aoutput-vol-get']['buckets']['+Inf'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
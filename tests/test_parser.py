@@ -0,0 +1,50 @@
+"""
+tests.test_parser
+~~~~~~~~~~~~~~~~~
+
+Parsing replies from the switch.
+"""
+
+import unittest
+
+from savantaudio.client import Scope, _tokenize
+
+from .helpers import SimulatorTestCase
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_reply_shapes(self):
+        self.assertEqual(_tokenize('aoutput-vol11:-20dB'), ('aoutput', 'vol', 11, '-20dB'))
+        self.assertEqual(_tokenize('aoutput-vol-set11:-20dB'), ('aoutput', 'vol', 11, '-20dB'))
+        self.assertEqual(_tokenize('ainput-trim3:2dB'), ('ainput', 'trim', 3, '2dB'))
+        self.assertEqual(_tokenize('switch12.7'), ('switch', '', 12, '7'))
+        self.assertEqual(_tokenize('fwrevPrimary; 1.0.0'), ('fwrev', '', 0, '1.0.0'))
+        self.assertEqual(_tokenize('fpga-rev1.0'), ('fpga-rev', '', 0, '1.0'))
+        self.assertIsNone(_tokenize('fwrevSecondary; 2.0.0'))
+        self.assertIsNone(_tokenize('bogus'))
+
+
+class TestParsing(SimulatorTestCase):
+
+    async def test_unknown_reply_raises(self):
+        switch = self.switch()
+        self.assertFalse(await switch.parse('err'))
+        self.assertFalse(await switch.parse('statusAPI2.0; something new'))
+        with self.assertRaises(ValueError):
+            await switch.parse('bogus')
+
+    async def test_extra_fwrev_lines_are_ignored(self):
+        execute = self.simulator._execute
+        def _execute(command):
+            if command == 'fwrev':
+                return ['fwrevPrimary; 1.0.0', 'fwrevSecondary; 2.0.0'], False
+            return execute(command)
+        self.simulator._execute = _execute
+        switch = self.switch()
+        await switch.refresh(Scope.INFO)
+        self.assertEqual(switch.attributes['fwrev'], '1.0.0')
+
+
+if __name__ == '__main__':
+    unittest.main()
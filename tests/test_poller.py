@@ -0,0 +1,102 @@
+"""
+tests.test_poller
+~~~~~~~~~~~~~~~~~
+
+The background poller, and the rate limiting it shares with the reconciler.
+"""
+
+import asyncio
+import collections
+import unittest
+
+from savantaudio.client import Scope
+from savantaudio.poller import Poller, TokenBucket
+
+from .helpers import SimulatorTestCase
+
+
+class TestTokenBucket(unittest.IsolatedAsyncioTestCase):
+
+    async def test_burst_then_rate(self):
+        bucket = TokenBucket(20.0)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(20):
+            await bucket.take()
+        self.assertLess(loop.time() - start, 0.05)
+        for _ in range(4):
+            await bucket.take()
+        self.assertGreater(loop.time() - start, 0.15)
+
+    async def test_rate_below_one(self):
+        bucket = TokenBucket(0.8) # holds one token, refilled every 1.25s
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async with asyncio.timeout(2):
+            await bucket.take()
+            await bucket.take()
+        self.assertGreater(loop.time() - start, 1.2)
+
+
+class TestPoller(SimulatorTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.sent = collections.Counter()
+        execute = self.simulator.execute
+        def record(command):
+            self.sent[command] += 1
+            return execute(command)
+        self.simulator.execute = record
+
+    async def test_intervals_per_scope(self):
+        switch = self.switch(pipeline_depth=8)
+        async with Poller(switch, {Scope.LINKS: 0.1, Scope.OUTPUT_MUTE: 0.5}, rate=1000):
+            await asyncio.sleep(0.65)
+        for output in range(1, 21):
+            self.assertGreaterEqual(self.sent[f'switch-get{output}'], 4)
+            self.assertLessEqual(self.sent[f'aoutput-mute-get{output}'], 2)
+        self.assertFalse(any(command.startswith('aoutput-vol') for command in self.sent))
+
+    async def test_active_output_is_polled_faster(self):
+        switch = self.switch()
+        async with Poller(switch, {Scope.OUTPUT_VOLUME: 10.0}, rate=1000, active_interval=0.05, active_window=5):
+            await asyncio.sleep(0.05)
+            self.simulator.push('aoutput-vol3:-5dB') # changed by someone else
+            await asyncio.sleep(0.5)
+        self.assertGreaterEqual(self.sent['aoutput-vol-get3'], 5)
+        self.assertEqual(self.sent['aoutput-vol-get10'], 0)
+
+    async def test_backoff_follows_latency(self):
+        switch = self.switch()
+        self.simulator.latency = 0.03
+        poller = Poller(switch, {Scope.LINKS: 0.01}, rate=1000, slow_latency=0.02, max_backoff=4.0)
+        async with poller:
+            await asyncio.sleep(0.3)
+            self.assertEqual(poller.backoff, 4.0)
+            self.simulator.latency = 0.0
+            await asyncio.sleep(0.5)
+            self.assertLess(poller.backoff, 2.0)
+        self.assertEqual(poller.failures, 0)
+
+    async def test_failures_back_off(self):
+        switch = self.switch(max_retries=0)
+        poller = Poller(switch, {Scope.LINKS: 0.01}, rate=1000, max_backoff=8.0)
+        async with poller:
+            await asyncio.sleep(0.05)
+            await self.simulator.close()
+            await asyncio.sleep(0.3)
+        self.assertGreater(poller.failures, 0)
+        self.assertGreater(poller.backoff, 1.0)
+
+    async def test_rate(self):
+        switch = self.switch(pipeline_depth=8)
+        async with Poller(switch, {Scope.LINKS: 0.01}, rate=20):
+            await asyncio.sleep(0.5)
+        # a full bucket of 20, then 20 a second
+        self.assertLessEqual(sum(self.sent.values()), 20 + 0.5 * 20 + 1)
+        self.assertGreaterEqual(sum(self.sent.values()), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
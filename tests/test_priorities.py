@@ -0,0 +1,67 @@
+"""
+tests.test_priorities
+~~~~~~~~~~~~~~~~~~~~~
+
+The priority scheduler for the connection's pipeline slots.
+"""
+
+import asyncio
+import unittest
+
+from savantaudio.client import Priority, Switch, _Slots
+from savantaudio.simulator import Simulator
+
+
+class TestPriorities(unittest.IsolatedAsyncioTestCase):
+
+    async def test_interactive_overtakes_queued_polls(self):
+        slots = _Slots(1)
+        await slots.acquire(Priority.POLL)
+        order = []
+        async def take(priority, name):
+            async with slots.hold(priority):
+                order.append(name)
+        tasks = [asyncio.create_task(take(Priority.POLL, f'poll{n}')) for n in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(take(Priority.INTERACTIVE, 'link')))
+        await asyncio.sleep(0)
+        slots.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ['link', 'poll0', 'poll1', 'poll2'])
+
+    async def test_background_is_not_starved(self):
+        slots = _Slots(1, patience=2)
+        await slots.acquire(Priority.INTERACTIVE)
+        order = []
+        async def take(priority, name):
+            async with slots.hold(priority):
+                order.append(name)
+        tasks = [asyncio.create_task(take(Priority.POLL, 'poll'))]
+        tasks += [asyncio.create_task(take(Priority.INTERACTIVE, f'set{n}')) for n in range(5)]
+        await asyncio.sleep(0)
+        slots.release()
+        await asyncio.gather(*tasks)
+        self.assertLess(order.index('poll'), 4)
+
+    async def test_reserved_slot_for_interactive(self):
+        slots = _Slots(2)
+        await slots.acquire(Priority.POLL)
+        await asyncio.wait_for(slots.acquire(Priority.INTERACTIVE), 0.1)
+        with self.assertRaises(TimeoutError):
+            await asyncio.wait_for(slots.acquire(Priority.POLL), 0.05)
+
+    async def test_interactive_command_is_not_stuck_behind_refresh(self):
+        async with Simulator(latency=0.005) as simulator:
+            switch = Switch(simulator.host, simulator.port)
+            try:
+                refresh = asyncio.create_task(switch.refresh())
+                await asyncio.sleep(0.02)
+                await switch.link(1, 2)
+                self.assertFalse(refresh.done())
+                await refresh
+            finally:
+                await switch.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+tests.test_reconciler
+~~~~~~~~~~~~~~~~~~~~~
+
+`Reconciler` holding the simulator at a scene.
+"""
+
+import asyncio
+import collections
+import unittest
+
+from savantaudio.client import OutputSettings, Scene
+from savantaudio.reconciler import Reconciler
+
+from .helpers import SimulatorTestCase
+
+
+class TestReconciler(SimulatorTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.sent = collections.Counter()
+        self.rejected = set()
+        execute = self.simulator.execute
+        def record(command):
+            self.sent[command] += 1
+            return (['err'], False) if command in self.rejected else execute(command)
+        self.simulator.execute = record
+        self.scene = Scene(links={1: 2}, outputs={3: OutputSettings(volume=-20), 4: OutputSettings(mute=True)})
+        # everything but output 3's volume is already as the scene wants it
+        self.simulator.links[1] = 2
+        self.simulator.mute[4] = True
+
+    def changes(self):
+        return {command: count for command, count in self.sent.items() if '-get' not in command}
+
+    async def test_only_drift_is_corrected(self):
+        reconciler = Reconciler(self.switch(), self.scene)
+        results = await reconciler.reconcile()
+        self.assertEqual([result.command for result in results], ['aoutput-vol-set3:-20dB'])
+        self.assertTrue(results[0].ok)
+        self.assertEqual(self.changes(), {'aoutput-vol-set3:-20dB': 1})
+        self.assertEqual(self.simulator.volume[3], -20)
+        self.assertEqual(await reconciler.reconcile(), [])
+        self.assertEqual(self.changes(), {'aoutput-vol-set3:-20dB': 1})
+
+    async def test_stats(self):
+        self.rejected.add('aoutput-vol-set5:-10dB')
+        reconciler = Reconciler(self.switch(), Scene(outputs={3: OutputSettings(volume=-20), 5: OutputSettings(volume=-10)}))
+        await reconciler.reconcile()
+        stats = reconciler.stats
+        self.assertEqual(stats['passes'], 1)
+        self.assertEqual(stats['drift'], {'aoutput-vol-set': 2})
+        self.assertEqual((stats['corrected'], stats['failed']), (1, 1))
+        self.assertFalse(stats['in_sync'])
+        self.assertIsNotNone(stats['last_drift'])
+        reconciler.scene = self.scene
+        self.simulator.volume[4] = -1 # not covered by the scene
+        await reconciler.reconcile()
+        self.assertEqual(reconciler.stats['passes'], 2)
+        self.assertTrue(reconciler.stats['in_sync'])
+
+    async def test_rate(self):
+        scene = Scene(outputs={output: OutputSettings(volume=-10) for output in range(1, 21)})
+        reconciler = Reconciler(self.switch(pipeline_depth=8), scene, rate=20)
+        await reconciler.refresh()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await reconciler.reconcile(refresh=False)
+        # a burst of 20 is allowed straight away, so make it wait for the next 10
+        self.assertEqual(len(results), 20)
+        self.assertLess(loop.time() - start, 0.5)
+        reconciler.scene = Scene(outputs={output: OutputSettings(volume=-5) for output in range(1, 11)})
+        start = loop.time()
+        await reconciler.reconcile(refresh=False)
+        self.assertGreaterEqual(loop.time() - start, 0.4)
+
+    async def test_pushed_change_brings_the_next_pass_forward(self):
+        switch = self.switch()
+        async with Reconciler(switch, self.scene, interval=60, settle=0.05) as reconciler:
+            async with asyncio.timeout(5):
+                while not reconciler.in_sync:
+                    await asyncio.sleep(0.01)
+            self.sent.clear()
+            self.simulator.volume[3] = -5
+            self.simulator.push('aoutput-vol3:-5dB') # someone turned it up at the keypad
+            async with asyncio.timeout(5):
+                while self.simulator.volume[3] != -20:
+                    await asyncio.sleep(0.01)
+            self.assertEqual(reconciler.passes, 2)
+            # the push said what changed, so nothing was re-read
+            self.assertEqual(self.sent, {'aoutput-vol-set3:-20dB': 1})
+
+    async def test_unrelated_change_is_ignored(self):
+        switch = self.switch()
+        async with Reconciler(switch, self.scene, interval=60, settle=0.01) as reconciler:
+            async with asyncio.timeout(5):
+                while not reconciler.in_sync:
+                    await asyncio.sleep(0.01)
+            self.simulator.push('aoutput-vol9:-5dB')
+            await asyncio.sleep(0.1)
+            self.assertEqual(reconciler.passes, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
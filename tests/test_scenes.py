@@ -0,0 +1,49 @@
+"""
+tests.test_scenes
+~~~~~~~~~~~~~~~~~
+
+Scenes: diffing cached state against desired state, and applying the difference.
+"""
+
+import unittest
+
+from savantaudio.client import Model, OutputSettings, Scene, Scope
+
+from .helpers import SimulatorTestCase
+
+
+class TestScenes(SimulatorTestCase):
+
+    async def test_diff_settles(self):
+        switch = self.switch(pipeline_depth=4)
+        scene = Scene({1: 2, 3: None}, {1: OutputSettings(volume=-10, mute=True, delay=(5, 6))})
+        results = await switch.apply_scene(scene)
+        self.assertTrue(all(result.ok for result in results))
+        await switch.refresh(Scope.LINKS | Scope.OUTPUTS, outputs=[1, 3])
+        self.assertEqual(switch.diff(scene), [])
+
+    async def test_only_changes_are_sent(self):
+        switch = self.switch(pipeline_depth=4)
+        await switch.refresh(Scope.LINKS | Scope.OUTPUTS, outputs=[1, 2])
+        self.simulator.links[2] = 5
+        await switch.refresh_link(2)
+        sent = self.simulator.commands
+        results = await switch.apply_scene(Scene({1: 3, 2: 5}, {1: OutputSettings(volume=0), 2: OutputSettings(volume=-4)}))
+        self.assertEqual([result.command for result in results], ['switch-set1.3', 'aoutput-vol-set2:-4dB'])
+        self.assertEqual(self.simulator.commands, sent + 2)
+        self.assertEqual(await switch.apply_scene(Scene({1: 3}, {2: OutputSettings(volume=-4)})), [])
+
+    async def test_delay_only_where_supported(self):
+        switch = self.switch()
+        with self.assertRaises(ValueError):
+            switch.diff(Scene(outputs={18: OutputSettings(delay=(5, 5))}))
+        with self.assertRaises(ValueError):
+            await switch.output(18).get_delay()
+        self.assertEqual(self.simulator.commands, 0)
+        old = self.switch(model=Model.SSA_3220)
+        with self.assertRaises(ValueError):
+            await old.output(1).set_delay(5, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
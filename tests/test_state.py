@@ -0,0 +1,100 @@
+"""
+tests.test_state
+~~~~~~~~~~~~~~~~
+
+Saving the cached state, and starting up from it.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from savantaudio.client import Scope
+
+from .helpers import SimulatorTestCase
+
+
+class TestStateFile(SimulatorTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'state.json')
+
+    async def test_round_trip(self):
+        self.simulator.links[3] = 4
+        self.simulator.volume[3] = -12
+        self.simulator.delay[2] = [5, 6]
+        self.simulator.trim[7] = 3
+        first = self.switch()
+        await first.connect(state_file=self.path)
+        self.assertTrue(os.path.exists(self.path))
+
+        sent = self.simulator.commands
+        second = self.switch()
+        await second.connect(state_file=self.path)
+        self.assertEqual(self.simulator.commands, sent) # loaded, not fetched
+        self.assertEqual(second.snapshot(), first.snapshot())
+        self.assertEqual(second.links, {3: 4})
+        self.assertEqual(second.output(3).volume, -12)
+        self.assertEqual(second.output(2).delay, (5, 6))
+        self.assertEqual(second.input(7).trim, 3)
+        await second.reconciled()
+
+    async def test_background_refresh_reports_differences(self):
+        first = self.switch()
+        await first.connect(state_file=self.path)
+        self.simulator.volume[5] = -20
+        second = self.switch()
+        changes = []
+        async def changed(event, output):
+            changes.append((event, output.number))
+        second.subscribe(changed, ('output-updated',))
+        await second.connect(state_file=self.path)
+        self.assertEqual(second.output(5).volume, 0)
+        await second.reconciled()
+        self.assertEqual(second.output(5).volume, -20)
+        self.assertEqual(changes, [('output-updated', 5)])
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)['outputs']['5'][0], -20)
+
+    async def test_corrupt_files_fall_back_to_a_refresh(self):
+        switch = self.switch()
+        await switch.refresh(Scope.INFO)
+        snapshot = switch.snapshot()
+        volume = json.loads(json.dumps(snapshot))
+        volume['outputs']['1'][0] = 100000 # too big for the state arrays
+        trim = json.loads(json.dumps(snapshot))
+        trim['inputs']['2'][0] = None
+        partial = json.loads(json.dumps(snapshot))
+        partial['links'] = {'1': 2}
+        partial['outputs']['3'] = [0]
+        for content in ('[]', 'not json', json.dumps(volume), json.dumps(trim), json.dumps(partial)):
+            with self.subTest(content=content[:20]):
+                with open(self.path, 'w') as f:
+                    f.write(content)
+                self.simulator.volume[1] = -3
+                loaded = self.switch()
+                sent = self.simulator.commands
+                await loaded.connect(state_file=self.path)
+                self.assertGreater(self.simulator.commands, sent) # refreshed instead
+                self.assertEqual(loaded.output(1).volume, -3)
+                self.assertEqual(loaded.links, {})
+
+    async def test_bad_snapshot_leaves_state_alone(self):
+        switch = self.switch()
+        await switch.link(1, 2)
+        await switch.output(1).refresh()
+        before = switch.snapshot()
+        bad = json.loads(json.dumps(before))
+        bad['links'] = {'1': 5}
+        bad['outputs']['1'][0] = -30
+        bad['outputs']['2'] = [0, None, 1, 0, 0, 0, 1]
+        with self.assertRaises(ValueError):
+            switch.restore(bad)
+        self.assertEqual(switch.snapshot(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
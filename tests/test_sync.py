@@ -0,0 +1,80 @@
+"""
+tests.test_sync
+~~~~~~~~~~~~~~~
+
+`SyncSwitch` and `LoopThread`, called from plain threads, against a simulator running on a loop thread of its own.
+"""
+
+import concurrent.futures
+import unittest
+
+from savantaudio.simulator import Simulator
+from savantaudio.sync import LoopThread, SyncSwitch
+
+
+class TestSyncSwitch(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator_thread = LoopThread('simulator')
+        self.addCleanup(self.simulator_thread.stop)
+        async def start():
+            simulator = Simulator(seed=1, latency=0.002)
+            await simulator.start()
+            return simulator
+        self.simulator = self.simulator_thread.run(start(), 5)
+        self.addCleanup(lambda: self.simulator_thread.run(self.simulator.close(), 5))
+
+    def switch(self, **kwargs) -> SyncSwitch:
+        switch = SyncSwitch(self.simulator.host, self.simulator.port, **kwargs)
+        self.addCleanup(switch.close)
+        return switch
+
+    def test_threads_share_one_connection(self):
+        switch = self.switch(pipeline_depth=4)
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda output: switch.output(output).set_volume(-output), range(1, 21)))
+            volumes = list(pool.map(lambda output: switch.output(output).get_volume(), range(1, 21)))
+        self.assertEqual(volumes, [-output for output in range(1, 21)])
+        self.assertEqual(self.simulator.volume[1:], volumes)
+        self.assertEqual(self.simulator_thread.call(lambda: self.simulator.connections), 1)
+        self.assertEqual(self.simulator.commands, 40)
+
+    def test_future_variants(self):
+        switch = self.switch()
+        self.simulator.volume[3] = -7
+        futures = [switch.link_future(3, 5), switch.output(3).get_volume_future()]
+        self.assertIsInstance(futures[0], concurrent.futures.Future)
+        concurrent.futures.wait(futures, 5)
+        self.assertEqual([future.result() for future in futures], [None, -7])
+        self.assertEqual(switch.links, {3: 5})
+
+    def test_blocking_call_on_the_loop_thread_fails(self):
+        switch = self.switch()
+        with self.assertRaisesRegex(RuntimeError, 'event loop thread'):
+            switch.thread.call(lambda: switch.output(1).get_volume())
+        with self.assertRaisesRegex(RuntimeError, 'event loop thread'):
+            switch.thread.call(lambda: switch.links)
+        self.assertEqual(self.simulator.commands, 0)
+
+    def test_close_stops_its_own_thread(self):
+        switch = SyncSwitch(self.simulator.host, self.simulator.port)
+        switch.link(1, 2)
+        switch.close()
+        self.assertFalse(switch.thread.running)
+        switch.close() # again, harmlessly
+
+    def test_close_leaves_a_shared_thread_running(self):
+        thread = LoopThread()
+        self.addCleanup(thread.stop)
+        first = SyncSwitch(self.simulator.host, self.simulator.port, thread=thread)
+        second = SyncSwitch(self.simulator.host, self.simulator.port, thread=thread)
+        first.close()
+        self.assertTrue(thread.running)
+        second.link(1, 2)
+        second.close()
+        self.assertTrue(thread.running)
+        self.assertEqual(self.simulator.links[1], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
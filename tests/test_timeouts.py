@@ -0,0 +1,47 @@
+"""
+tests.test_timeouts
+~~~~~~~~~~~~~~~~~~~
+
+Per-command timeouts, cancellation and deadlines.
+"""
+
+import asyncio
+import unittest
+
+from .helpers import SimulatorTestCase
+
+
+class TestTimeouts(SimulatorTestCase):
+    simulator_options = {'latency': 0.01}
+
+    async def test_refresh_deadline_stops_sending(self):
+        switch = self.switch()
+        with self.assertRaises(TimeoutError):
+            await switch.refresh(timeout=0.1)
+        sent = self.simulator.commands
+        await asyncio.sleep(0.2)
+        self.assertLessEqual(self.simulator.commands, sent + 1)
+
+    async def test_timed_out_reply_is_discarded(self):
+        switch = self.switch(pipeline_depth=4)
+        self.simulator.volume[2] = -2
+        self.simulator.latency = 0.2
+        with self.assertRaises(TimeoutError):
+            await switch.send_command('aoutput-vol-get1', timeout=0.05)
+        self.simulator.latency = 0.0
+        # the late reply to the first command must not be taken for this one's
+        self.assertEqual(await switch.send_command('aoutput-vol-get2'), ['aoutput-vol2:-2dB'])
+        self.assertEqual(switch.connection.in_flight, 0)
+
+    async def test_cancelled_command_frees_its_slot(self):
+        switch = self.switch(pipeline_depth=1)
+        self.simulator.volume[2] = -2
+        first = asyncio.create_task(switch.send_command('aoutput-vol-get1'))
+        await asyncio.sleep(0.001)
+        first.cancel()
+        async with asyncio.timeout(1):
+            self.assertEqual(await switch.send_command('aoutput-vol-get2'), ['aoutput-vol2:-2dB'])
+
+
+if __name__ == '__main__':
+    unittest.main()